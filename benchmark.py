@@ -0,0 +1,486 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy
+
+import depth
+import filters
+
+RESOLUTIONS = {
+    "qvga": (320, 240),
+    "vga": (640, 480),
+    "hd": (1280, 720),
+    "fhd": (1920, 1080),
+}
+
+BENCHMARKS = {}
+RESOLUTION_INDEPENDENT = set()
+
+
+def benchmark(name, perResolution=True):
+    """
+    Register a benchmark setup function.
+
+    The setup function takes a synthetic BGR frame and a shared context
+    dict, and returns the zero-argument callable to be timed. Benchmarks
+    registered with perResolution=False run at the first resolution only.
+    """
+
+    def register(setup):
+        BENCHMARKS[name] = setup
+        if not perResolution:
+            RESOLUTION_INDEPENDENT.add(name)
+        return setup
+
+    return register
+
+
+def makeFrame(width, height, seed=0):
+    """
+    Build a deterministic BGR test frame with gradients, noise and shapes.
+    """
+    rng = numpy.random.default_rng(seed)
+    noise = rng.integers(0, 256, (height, width, 3), dtype=numpy.uint8)
+    noise = cv2.GaussianBlur(noise, (0, 0), 3)
+    xs = numpy.linspace(0, 255, width, dtype=numpy.float32)
+    ys = numpy.linspace(0, 255, height, dtype=numpy.float32)
+    gradient = (xs[numpy.newaxis, :] + ys[:, numpy.newaxis]) / 2
+    frame = cv2.addWeighted(
+        noise, 0.5, cv2.merge([gradient.astype(numpy.uint8)] * 3), 0.5, 0
+    )
+    for _ in range(8):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(10, width // 6)), int(rng.integers(10, height // 6)))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.ellipse(frame, center, axes, 0, 0, 360, color, -1)
+    return frame
+
+
+def makeFace(size):
+    """
+    Draw a gray frontal face, with eyes, that the Haar cascades detect.
+    """
+    face = numpy.full((200, 200), 90, dtype=numpy.uint8)
+    cv2.ellipse(face, (100, 105), (72, 95), 0, 0, 360, 200, -1)
+    for x in (70, 130):
+        cv2.ellipse(face, (x, 62), (22, 6), 0, 0, 360, 60, -1)
+        cv2.ellipse(face, (x, 85), (16, 9), 0, 0, 360, 235, -1)
+        cv2.circle(face, (x, 85), 7, 20, -1)
+    cv2.ellipse(face, (100, 120), (10, 22), 0, 0, 360, 170, -1)
+    cv2.ellipse(face, (100, 158), (30, 9), 0, 0, 360, 70, -1)
+    face = cv2.GaussianBlur(face, (0, 0), 2)
+    return cv2.cvtColor(cv2.resize(face, (size, size)), cv2.COLOR_GRAY2BGR)
+
+
+def makeFaceFrame(width, height, faceImage=None, count=2, seed=0):
+    """
+    Build a makeFrame frame with count faces side by side in it.
+
+    faceImage, e.g. a positive sample cropped to the face, is pasted in
+    place of the drawn face of makeFace.
+    """
+    frame = makeFrame(width, height, seed)
+    size = min(int(height * 0.45), width // (count + 1))
+    if faceImage is None:
+        face = makeFace(size)
+    else:
+        face = cv2.resize(faceImage, (size, size))
+        if face.ndim < 3:
+            face = cv2.cvtColor(face, cv2.COLOR_GRAY2BGR)
+    gap = (width - count * size) // (count + 1)
+    y = (height - size) // 2
+    for index in range(count):
+        x = gap + index * (size + gap)
+        frame[y : y + size, x : x + size] = face
+    return frame
+
+
+def makeDisparity(width, height, seed=0):
+    rng = numpy.random.default_rng(seed)
+    disparity = rng.integers(0, 256, (height, width), dtype=numpy.uint8)
+    disparity = cv2.GaussianBlur(disparity, (0, 0), 8)
+    validDepthMask = (rng.random((height, width)) > 0.05).astype(numpy.uint8) * 255
+    return disparity, validDepthMask
+
+
+def _filterBenchmark(filterClass):
+    def setup(frame, context):
+        instance = filterClass()
+        dst = numpy.empty_like(frame)
+        return lambda: instance.apply(frame, dst)
+
+    return setup
+
+
+for _name, _class in [
+    ("filters.SharpenFilter", filters.SharpenFilter),
+    ("filters.FindEdgesFilter", filters.FindEdgesFilter),
+    ("filters.BlurFilter", filters.BlurFilter),
+    ("filters.EmpossFilter", filters.EmpossFilter),
+]:
+    benchmark(_name)(_filterBenchmark(_class))
+
+
+@benchmark("filters.strokeEdges")
+def _strokeEdges(frame, context):
+    dst = numpy.empty_like(frame)
+    return lambda: filters.strokeEdges(frame.copy(), dst)
+
+
+@benchmark("filters.StripScheduler.strokeEdges")
+def _stripStrokeEdges(frame, context):
+    scheduler = filters.StripScheduler(filters.StrokeEdgesFilter())
+    dst = numpy.empty_like(frame)
+    return lambda: scheduler.apply(frame, dst)
+
+
+@benchmark("filters.StripScheduler.strokeEdges.inPlace")
+def _stripStrokeEdgesInPlace(frame, context):
+    scheduler = filters.StripScheduler(filters.StrokeEdgesFilter())
+    dst = frame.copy()
+    return lambda: scheduler.apply(dst, dst)
+
+
+@benchmark("tracker.FaceTracker.update")
+def _faceTracker(frame, context):
+    from tracker import FaceTracker
+
+    faceTracker = FaceTracker()
+    return lambda: faceTracker.update(frame)
+
+
+@benchmark("tracker.ObjectTracker.update")
+def _objectTracker(frame, context):
+    from tracker import ObjectTracker
+
+    objectTracker = ObjectTracker("HaarCascades/haarcascade_frontalface_default.xml")
+    return lambda: objectTracker.update(frame)
+
+
+def _withFaces(frame, context, tracker, detections):
+    height, width = frame.shape[:2]
+    frame = makeFaceFrame(width, height, context.get("faceImage"))
+    tracker.update(frame)
+    # Without detections this would time the empty-frame case again.
+    if not len(detections(tracker)):
+        raise RuntimeError("No detections in the face frame")
+    return lambda: tracker.update(frame)
+
+
+@benchmark("tracker.FaceTracker.update.faces")
+def _faceTrackerFaces(frame, context):
+    from tracker import FaceTracker
+
+    return _withFaces(frame, context, FaceTracker(), lambda tracker: tracker.faces)
+
+
+@benchmark("tracker.ObjectTracker.update.faces")
+def _objectTrackerFaces(frame, context):
+    from tracker import ObjectTracker
+
+    objectTracker = ObjectTracker("HaarCascades/haarcascade_frontalface_default.xml")
+    return _withFaces(frame, context, objectTracker, lambda tracker: tracker.objects)
+
+
+@benchmark("depth.createMedianMask")
+def _createMedianMask(frame, context):
+    height, width = frame.shape[:2]
+    disparityMap, validDepthMask = makeDisparity(width, height)
+    dst = numpy.empty((height, width), dtype=numpy.uint8)
+    return lambda: depth.createMedianMask(disparityMap, validDepthMask, dst=dst)
+
+
+@benchmark("depth.createMedianMasks")
+def _createMedianMasks(frame, context):
+    height, width = frame.shape[:2]
+    disparityMap, validDepthMask = makeDisparity(width, height)
+    rects = [
+        (x, y, width // 8, height // 8)
+        for x in range(0, width, width // 4)
+        for y in range(0, height, height // 4)
+    ]
+    dst = numpy.empty((height, width), dtype=numpy.uint8)
+    return lambda: depth.createMedianMasks(disparityMap, validDepthMask, rects, dst)
+
+
+def _depthQueryRects(frame):
+    height, width = frame.shape[:2]
+    depthMap = makeDisparity(width, height)[0].astype(numpy.float32) * 10
+    rng = numpy.random.default_rng(0)
+    rects = numpy.column_stack([
+        rng.integers(0, width // 2, 32),
+        rng.integers(0, height // 2, 32),
+        rng.integers(16, width // 2, 32),
+        rng.integers(16, height // 2, 32),
+    ])
+    return depth.DepthQuery(depthMap, scale=0.001), rects
+
+
+@benchmark("depth.DepthQuery.rectDistances")
+def _rectDistances(frame, context):
+    query, rects = _depthQueryRects(frame)
+    return lambda: query.rectDistances(rects)
+
+
+@benchmark("depth.DepthQuery.rectDistances.sampled")
+def _rectDistancesSampled(frame, context):
+    query, rects = _depthQueryRects(frame)
+    return lambda: query.rectDistances(rects, samples=16)
+
+
+@benchmark("codec.jpegEncode")
+def _jpegEncode(frame, context):
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
+    return lambda: cv2.imencode(".jpeg", frame, params)
+
+
+@benchmark("codec.jpegDecode")
+def _jpegDecode(frame, context):
+    _, encoded = cv2.imencode(".jpeg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+    return lambda: cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED)
+
+
+@benchmark("startup.importCameo", perResolution=False)
+def _importCameo(frame, context):
+    command = [sys.executable, "-c", "import cameo"]
+    return lambda: subprocess.run(command, check=True)
+
+
+@benchmark("startup.FaceTracker", perResolution=False)
+def _faceTrackerStartup(frame, context):
+    command = [
+        sys.executable,
+        "-c",
+        "import numpy, tracker; "
+        "tracker.FaceTracker().update(numpy.zeros((240, 320, 3), numpy.uint8))",
+    ]
+    return lambda: subprocess.run(command, check=True)
+
+
+class Loopback(object):
+    """
+    A CVServer and a CVClient connected over the loopback interface.
+    """
+
+    def __init__(self, port):
+        from cvclient import CVClient
+        from cvserver import CVServer
+
+        self.server = CVServer("127.0.0.1", port)
+        self.server.start_server()
+        self.client = CVClient("127.0.0.1", port)
+        if not self.client.is_connected:
+            raise RuntimeError("Loopback client can't connect to the server")
+
+    def roundTrip(self, frame):
+        self.server.send_frame(frame)
+        self.client.grab()
+        return self.client.retrieve()
+
+    def close(self):
+        self.client.release()
+        self.server.stop_server()
+
+
+@benchmark("transport.roundTrip")
+def _roundTrip(frame, context):
+    if context.get("loopback") is None:
+        context["loopback"] = Loopback(context["port"])
+    loopback = context["loopback"]
+    return lambda: loopback.roundTrip(frame)
+
+
+def timeCallable(function, repeat, warmup):
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    mean = statistics.fmean(samples)
+    return {
+        "repeat": repeat,
+        "mean": mean,
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min": samples[0],
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "fps": 1.0 / mean if mean > 0 else 0.0,
+    }
+
+
+def environment():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "type": "environment",
+        "time": time.time(),
+        "revision": revision,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "cvThreads": cv2.getNumThreads(),
+    }
+
+
+def run(names, resolutions, repeat, warmup, port, output, faceImage=None):
+    logger = logging.getLogger("Benchmark")
+    output.write(json.dumps(environment()) + "\n")
+    context = {"port": port, "loopback": None, "faceImage": None}
+    if faceImage:
+        context["faceImage"] = cv2.imread(faceImage)
+        if context["faceImage"] is None:
+            raise cv2.error(f"Can't read face image {faceImage}")
+    try:
+        for resolution in resolutions:
+            width, height = RESOLUTIONS[resolution]
+            frame = makeFrame(width, height)
+            for name in names:
+                if name in RESOLUTION_INDEPENDENT and resolution != resolutions[0]:
+                    continue
+                logger.info(f"Run {name} At {resolution} ({width}x{height})")
+                try:
+                    function = BENCHMARKS[name](frame, context)
+                    result = timeCallable(function, repeat, warmup)
+                except Exception as e:
+                    logger.error(f"Benchmark {name} Failed: {e}")
+                    result = {"error": str(e)}
+                record = {
+                    "type": "result",
+                    "name": name,
+                    "resolution": resolution,
+                    "width": width,
+                    "height": height,
+                }
+                record.update(result)
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+    finally:
+        if context["loopback"] is not None:
+            context["loopback"].close()
+
+
+def loadResults(path):
+    results = {}
+    with open(path) as file:
+        for line in file:
+            record = json.loads(line)
+            if record.get("type") == "result" and "median" in record:
+                results[(record["name"], record["resolution"])] = record
+    return results
+
+
+def compare(baselinePath, candidatePath):
+    """
+    Print the median time of each benchmark found in both runs.
+    """
+    baseline = loadResults(baselinePath)
+    candidate = loadResults(candidatePath)
+    print(f"{'benchmark':<36} {'res':<5} {'base ms':>10} {'new ms':>10} {'speedup':>8}")
+    for key in sorted(set(baseline) & set(candidate)):
+        before = baseline[key]["median"] * 1000
+        after = candidate[key]["median"] * 1000
+        speedup = before / after if after > 0 else float("inf")
+        print(f"{key[0]:<36} {key[1]:<5} {before:>10.3f} {after:>10.3f} {speedup:>7.2f}x")
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark filters, trackers, codec and transport on synthetic frames."
+    )
+    parser.add_argument(
+        "-b",
+        "--benchmark",
+        dest="names",
+        action="append",
+        help="Benchmark name or prefix to run, may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "-r",
+        "--resolution",
+        dest="resolutions",
+        action="append",
+        choices=list(RESOLUTIONS),
+        help="Resolution to run at, may be repeated (default: qvga, vga, hd)",
+    )
+    parser.add_argument("-n", "--repeat", dest="repeat", default=30, type=int)
+    parser.add_argument("-w", "--warmup", dest="warmup", default=3, type=int)
+    parser.add_argument(
+        "-p",
+        "--port",
+        dest="port",
+        default=9999,
+        type=int,
+        help="UDP port for the loopback transport benchmark",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        help="Write JSON lines results into this file instead of stdout",
+    )
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASELINE", "CANDIDATE"),
+        help="Compare two result files instead of running",
+    )
+    parser.add_argument(
+        "--face-image",
+        dest="faceImage",
+        metavar="PATH",
+        help="Face image, e.g. a positive sample cropped to the face, to paste into the frames "
+        "of the .faces benchmarks instead of a drawn face",
+    )
+    parser.add_argument("--list", action="store_true", help="List benchmarks and exit")
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_args().parse_args()
+    logging.basicConfig(
+        format="[%(asctime)s.%(msecs)03d] [%(levelname)s] (%(name)s): %(message)s",
+        level=logging.INFO,
+        datefmt="%H:%M:%S",
+        stream=sys.stderr,
+    )
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    if args.compare:
+        args.compare = [os.path.abspath(path) for path in args.compare]
+    if args.faceImage:
+        args.faceImage = os.path.abspath(args.faceImage)
+    # The trackers load their cascades relative to the repository root.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if args.list:
+        print("\n".join(BENCHMARKS))
+    elif args.compare:
+        compare(*args.compare)
+    else:
+        names = [
+            name for name in BENCHMARKS
+            if not args.names or any(name.startswith(prefix) for prefix in args.names)
+        ]
+        resolutions = args.resolutions or ["qvga", "vga", "hd"]
+        if args.output:
+            with open(args.output, "w") as output:
+                run(names, resolutions, args.repeat, args.warmup, args.port, output, args.faceImage)
+        else:
+            run(names, resolutions, args.repeat, args.warmup, args.port, sys.stdout, args.faceImage)
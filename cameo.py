@@ -1,34 +1,85 @@
 import cv2
 import logging
 import argparse
-import shutil
-import os
+import time
+
+import numpy
 
 import filters
 import utils
-from manager import CaptureManager, WindowManager
+from detections import drawDetections
+from manager import CaptureManager, WindowManager, openCapture
+from metrics import PipelineMetrics
+import tracing
 from tracker import FaceTracker, ObjectTracker
-from cvserver import CVServer
-from cvclient import CVClient
 
 
 class Cameo(object):
-    def __init__(self, Capture, logger="Cameo", detect=None, trashold=None):
+    def __init__(
+        self,
+        Capture,
+        logger="Cameo",
+        detect=None,
+        trashold=None,
+        metrics=None,
+        displayFps=None,
+        targetFps=None,
+        motion=False,
+        preroll=None,
+        tracePath=None,
+        traceCapacity=tracing.DEFAULT_CAPACITY,
+        strips=None,
+        detectionLog=None,
+        preview=True,
+    ):
         self._logger = logging.getLogger(logger)
-        self._windowManager = WindowManager("Window", self.onKeypress)
+        self._capture = Capture
+        self._windowManager = None
+        if preview:
+            self._windowManager = WindowManager(
+                "Window", self.onKeypress, maxDisplayFps=displayFps
+            )
         self._captureManager = CaptureManager(
             Capture,
             self._windowManager,
+            metrics=metrics,
+            prerollSeconds=preroll,
         )
 
         self._track = None
         self.shouldTracking = False
         if detect:
-            self._track = ObjectTracker(detect, scaleFactor=trashold)
+            self._track = ObjectTracker(detect, scaleFactor=trashold or 1.3)
 
-        self._faceTrack = FaceTracker(scaleFactor=trashold, minNeighbors=10)
+        self._faceTrack = FaceTracker(scaleFactor=trashold or 1.3, minNeighbors=10)
         self.shouldTrackingFace = False
 
+        self._governor = None
+        if targetFps:
+            from governor import PerformanceGovernor
+
+            self._governor = PerformanceGovernor(
+                targetFps, [t for t in (self._faceTrack, self._track) if t is not None]
+            )
+
+        self._motion = None
+        if motion:
+            from motion import MotionDetector
+
+            self._motion = MotionDetector()
+
+        self._tracePath = tracePath
+        self._traceCapacity = traceCapacity
+        if tracePath:
+            tracing.enable(traceCapacity)
+
+        self._detectionLog = None
+        if detectionLog:
+            from detectionlog import DetectionLogWriter
+
+            self._detectionLog = DetectionLogWriter(detectionLog)
+
+        self._strips = strips
         self._curveFilter = None
         self.applyFilter = False
 
@@ -39,24 +90,89 @@ class Cameo(object):
         self._showFPS = False
         self._windowManager.createWindow()
         while self._windowManager.isWindowCreated:
+            if not self._captureManager.isOpened:
+                # A CVClient closes when its server goes away.
+                self._logger.warning("The Capture Is Closed, Stop")
+                self._windowManager.destroyWindow()
+                break
             with self._captureManager as frame:
                 if frame is not None:
-                    if self._showFPS:
-                        fps_text = self._captureManager.fps
-                        cv2.putText(frame, fps_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                    if self.shouldTrackingFace:
-                        self._faceTrack.update(frame)
-                        self._faceTrack.drawDebugRects(frame)
-
-                    if self._track is not None and self.shouldTracking:
-                        self._track.update(frame)
-                        self._track.drawDebugRects(frame)
-
-                if self.applyFilter:
-                    self._curveFilter.apply(frame, frame)
+                    self._processFrame(frame)
             self._windowManager.processEvent()
+            if self._governor is not None:
+                self._governor.tick()
+        self._close()
 
+    def _processFrame(self, frame, draw=True):
+        """
+        Track, draw and filter one frame in place.
+        """
+        metrics = self._captureManager.metrics
+        sequence = self._captureManager.frameSequence
+        shouldDetect = self._governor is None or self._governor.shouldDetect(sequence)
+        region = None
+        if self._motion is not None and (self.shouldTrackingFace or self.shouldTracking):
+            with metrics.measure("motion"):
+                # Motion of frames the governor skips is merged into the next region.
+                region = self._motion.update(frame, shouldDetect)
+            shouldDetect = shouldDetect and region is not None
+
+        if self._showFPS:
+            fps_text = self._captureManager.fps
+            color = 255 if utils.isGray(frame) else (0, 255, 0)
+            cv2.putText(frame, fps_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
+        if self.shouldTrackingFace:
+            if shouldDetect:
+                with metrics.measure("faceTrack"):
+                    self._faceTrack.update(frame, sequence, region)
+                self._logDetections(self._faceTrack.faces, sequence)
+            if draw:
+                self._faceTrack.drawDebugRects(frame)
+
+        if self._track is not None and self.shouldTracking:
+            if shouldDetect:
+                with metrics.measure("objectTrack"):
+                    self._track.update(frame, sequence, region)
+                self._logDetections(self._track.objects, sequence)
+            if draw:
+                self._track.drawDebugRects(frame)
+
+        # A CVClient carries the detections of the server along with the frame.
+        remoteDetections = getattr(self._capture, "detections", None)
+        if draw and remoteDetections is not None:
+            drawDetections(frame, remoteDetections)
+
+        if self.applyFilter:
+            with metrics.measure("filter"):
+                self._curveFilter.apply(frame, frame)
+
+    @property
+    def detections(self):
+        """
+        Current DETECTION_DTYPE rows of every enabled tracker.
+        """
+        detections = []
+        if self.shouldTrackingFace:
+            detections.append(self._faceTrack.faces)
+        if self._track is not None and self.shouldTracking:
+            detections.append(self._track.objects)
+        return numpy.concatenate(detections) if detections else None
+
+    def _close(self):
         self._captureManager.close()
+        if self._detectionLog is not None:
+            self._detectionLog.close()
+        if tracing.isEnabled():
+            self._dumpTrace()
+
+    def _logDetections(self, detections, sequence):
+        if self._detectionLog is not None:
+            # Detections kept from earlier frames are already logged.
+            self._detectionLog.append(detections[detections["frame"] == sequence])
+
+    def _dumpTrace(self):
+        tracing.dump(self._tracePath or time.strftime("trace-%Y%m%d-%H%M%S.json"))
+        tracing.disable()
 
     def onKeypress(self, keycode):
         """
@@ -64,6 +180,8 @@ class Cameo(object):
         space -> Take a screenshot
         x -> Start/Stop Face Tracking
         tab -> Start/Stop recording a screencast.
+        r -> Start/Stop recording raw frames.
+        c -> Start/Stop tracing, the trace is saved when it stops.
         escape -> Quit.
         """
         if keycode == 32:  # space
@@ -75,6 +193,13 @@ class Cameo(object):
                 )
             else:
                 self._captureManager.stopWriteVideo()
+        elif keycode == ord("r"):
+            if not self._captureManager.isWritingRaw:
+                self._captureManager.startWriteRaw(
+                    time.strftime("rawcapture-%Y%m%d-%H%M%S")
+                )
+            else:
+                self._captureManager.stopWriteRaw()
         elif keycode in [ord('b'), ord('s'), ord('e'), ord('d')]:
             if keycode == ord("b"):
                 self._logger.info(
@@ -100,11 +225,19 @@ class Cameo(object):
                     + ("Started" if not self.applyFilter else "Stoped")
                 )
                 self._curveFilter = filters.FindEdgesFilter()
+            if self._strips:
+                self._curveFilter = filters.StripScheduler(self._curveFilter, self._strips)
             self.applyFilter = not self.applyFilter
 
         elif keycode == ord("f"):
             self._showFPS = not self._showFPS
 
+        elif keycode == ord("c"):
+            if tracing.isEnabled():
+                self._dumpTrace()
+            else:
+                tracing.enable(self._traceCapacity)
+
         elif keycode == ord("j"):
             self._logger.info(
                 "Object Tracking "
@@ -129,22 +262,10 @@ class CameoLabelTaker(object):
         )
         self.takeSS = False
         self.filepath = 'takedImages'
-        self.p_count = 0
-        self.n_count = 0
-        for filepath in [f"{self.filepath}/negative", f"{self.filepath}/positive"]:
-            if not os.path.exists(filepath):
-                os.makedirs(filepath)
-            else:
-                count = 0
-                for file in os.listdir(filepath):
-                    l = int(file.split('.')[0])
-                    if l >= count:
-                        count = l + 1
-                if filepath[len(self.filepath) + 1:] == 'positive':
+        self._sampleKind = None
+        from samples import SampleStore
 
-                    self.p_count = count
-                else:
-                    self.n_count = count
+        self._samples = SampleStore(self.filepath)
 
     def run(self):
         """
@@ -157,13 +278,16 @@ class CameoLabelTaker(object):
             with self._captureManager as frame:
                 if frame is not None:
                     if self.takeSS:
-                        cv2.imwrite(self.file, cv2.resize(frame, (640, 480)))
+                        if self._sampleKind == 'positive':
+                            self._samples.addPositive(frame, self.rectSize)
+                        else:
+                            self._samples.addNegative(frame)
                         self.takeSS = not self.takeSS
                         utils.outlineRect(frame, self.rectSize, (0,255,0))
                     else:
                         utils.outlineRect(frame, self.rectSize, (255,0,0))
-                    cv2.putText(frame, 'Count For Positive Image: {}'.format(self.p_count), (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                    cv2.putText(frame, 'Count For Negative Image: {}'.format(self.n_count), (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+                    cv2.putText(frame, 'Count For Positive Image: {}'.format(self._samples.positiveCount), (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+                    cv2.putText(frame, 'Count For Negative Image: {}'.format(self._samples.negativeCount), (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
             self._windowManager.processEvent()
 
     def onKeypress(self, keycode):
@@ -178,8 +302,8 @@ class CameoLabelTaker(object):
         a = 12
         if keycode == 27:  # ESC
             self._windowManager.destroyWindow()
-            self._logger.info(f'Archive Images To {self.filepath}.tar.gz')
-            shutil.make_archive(self.filepath, 'gztar', self.filepath)
+            self._samples.archive()
+            self._samples.close()
         elif keycode == 84:
             x, y, w, h = self.rectSize
             self.rectSize = (x, y+a, w, h)
@@ -205,40 +329,56 @@ class CameoLabelTaker(object):
             x, y, w, h = self.rectSize
             self.rectSize = (x+a, y, w-a, h)
         elif keycode == ord('n'):
-            self.file = f'{self.filepath}/negative/{self.n_count}.jpg'
-            open(f'{self.filepath}/neg.txt', 'a').write(f'negative/{self.n_count}.jpg\n')
-            self.n_count += 1
-            self.takeSS = not self.takeSS
+            self._sampleKind = 'negative'
+            self.takeSS = True
         elif keycode == ord('p'):
-            self.file = f'{self.filepath}/positive/{self.p_count}.jpg'
-            open(f"{self.filepath}/positive/{self.p_count}.txt", 'w').write(f"0 {' '.join([str(x) for x in self.rectSize])}\n")
-            self.p_count += 1
-            self.takeSS = not self.takeSS
+            self._sampleKind = 'positive'
+            self.takeSS = True
         elif keycode == ord('s'):
-            self._logger.info(f'Archive Images To {self.filepath}.tar.gz')
-            shutil.make_archive(self.filepath, 'gztar', self.filepath)
+            self._samples.archive()
 
 
 class CameoServer(Cameo):
-    def __init__(self, Capture, address='localhost', logger="CameoServer"):
-        self._logger = logging.getLogger(logger)
-        self._server = CVServer(address)
-        self._captureManager = CaptureManager(
-            Capture
-        )
+    def __init__(self, Capture, address='localhost', logger="CameoServer", **options):
+        """
+        Takes the options of Cameo, without a preview window.
+        """
+        from cvserver import CVServer
+
+        super().__init__(Capture, logger, preview=False, **options)
+        self._server = CVServer(address, metrics=self._captureManager.metrics)
+        # Detection costs a core per stream, the server only runs it for -f.
+        self.shouldTracking = self._track is not None
+        self.shouldTrackingFace = False
 
     def run(self):
         """
         Run Main loop.
         """
+        self._showFPS = False
         self._server.start_server()
         try:
-            while True:
+            while self._captureManager.isOpened:
                 with self._captureManager as frame:
-                    if frame is not None:
-                        self._server.send_frame(frame)
+                    if frame is None:
+                        self._logger.warning("The Capture Ended, Stop")
+                        break
+                    if self._server.is_connected:
+                        # The client gets the detections, the frame stays clean.
+                        self._processFrame(frame, draw=False)
+                        with tracing.span("sendFrame"):
+                            self._server.send_frame(
+                                frame,
+                                detections=self.detections,
+                                timestamp=self._captureManager.frameTimestamp,
+                            )
+                if self._governor is not None:
+                    self._governor.tick()
         except KeyboardInterrupt:
+            pass
+        finally:
             self._server.stop_server()
+            self._close()
 
 class CameoDepth(Cameo):
     def __init__(self, loggerName="CameoDepth"):
@@ -246,9 +386,18 @@ class CameoDepth(Cameo):
         # device = cv2.CAP_OPENNI2_ASUS
         device = cv2.CAP_OPENNI2
         self._captureManager = CaptureManager(
-            cv2.VideoCapture(device), self._windowManager, True, True
+            cv2.VideoCapture(device),
+            self._windowManager,
+            True,
+            True,
+            channels=(
+                cv2.CAP_OPENNI_DISPARITY_MAP,
+                cv2.CAP_OPENNI_VALID_DEPTH_MASK,
+                cv2.CAP_OPENNI_BGR_IMAGE,
+            ),
         )
         self._curveFilter = filters.SharpenFilter()
+        self._depthMask = None
         self._logger = logging.getLogger(loggerName)
         self._logger.debug(f"Initial Class {loggerName}")
 
@@ -256,13 +405,18 @@ class CameoDepth(Cameo):
         """
         Run the main loop
         """
+        import depth
+
         self._windowManager.createWindow()
         while self._windowManager.isWindowCreated:
             self._captureManager.enterFrame()
-            self._captureManager.channel = cv2.CAP_OPENNI_DISPARITY_MAP
-            disparityMap = self._captureManager.frame
-            self._captureManager.channel = cv2.CAP_OPENNI_VALID_DEPTH_MASK
-            validDepthMask = self._captureManager.frame
+            frames = self._captureManager.frameSet
+            if frames is None:
+                self._captureManager.exitFrame()
+                self._windowManager.processEvent()
+                continue
+            disparityMap = frames[cv2.CAP_OPENNI_DISPARITY_MAP]
+            validDepthMask = frames[cv2.CAP_OPENNI_VALID_DEPTH_MASK]
             self._captureManager.channel = cv2.CAP_OPENNI_BGR_IMAGE
             frame = self._captureManager.frame
             if frame is None:
@@ -272,7 +426,9 @@ class CameoDepth(Cameo):
                 self._captureManager.channel = cv2.CAP_OPENNI_IR_IMAGE
                 frame = self._captureManager.frame
             if frame is not None:
-                mask = depth.createMedianMask(disparityMap, validDepthMask)
+                mask = self._depthMask = depth.createMedianMask(
+                    disparityMap, validDepthMask, dst=self._depthMask
+                )
                 frame[mask == 0] = 0
                 if self._captureManager.channel == cv2.CAP_OPENNI_BGR_IMAGE:
                     self._curveFilter.apply(frame, frame)
@@ -285,8 +441,9 @@ def get_args():
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "cap",
-        default=0,
-        help="video file or a capturing device or an IP video stream for video capturing.",
+        nargs="+",
+        help="video file or a capturing device or an IP video stream for video capturing. "
+        "Several sources run together in one process, 'client:host[:port]' reads from a CameoServer.",
     )
     parser.add_argument(
         "-i",
@@ -312,7 +469,7 @@ def get_args():
         "-s",
         "--server",
         dest='address',
-        help="Enable Server Mode To Start Lisining On The Address Given",
+        help="Enable Server Mode To Start Lisining On The Address Given, With -f It Also Sends The Detections",
     )
     parser.add_argument(
         "-t",
@@ -322,6 +479,139 @@ def get_args():
         type=float,
         help="Trashold Value For Cascade classifing",
     )
+    parser.add_argument(
+        "-r",
+        "--replay",
+        dest="replay",
+        action="store_true",
+        help="Replay The Video File, Image Directory Or Raw Frame Store Given On 'cap' Deterministically",
+    )
+    parser.add_argument(
+        "--rate",
+        dest="rate",
+        default="realtime",
+        help="Replay Rate: 'realtime', 'unlimited' Or Frames Per Second",
+    )
+    parser.add_argument(
+        "--loop",
+        dest="loop",
+        action="store_true",
+        help="Restart Replay From The First Frame When It Ends",
+    )
+    parser.add_argument(
+        "-d",
+        "--display-fps",
+        dest="displayFps",
+        type=float,
+        help="Draw The Window On Its Own Thread At Most This Many Times A Second",
+    )
+    parser.add_argument(
+        "-g",
+        "--target-fps",
+        dest="targetFps",
+        type=float,
+        help="Lower Detection Cost Whenever The Main Loop Falls Below This FPS",
+    )
+    parser.add_argument(
+        "--motion",
+        dest="motion",
+        action="store_true",
+        help="Run Trackers Only Where Something Moved",
+    )
+    parser.add_argument(
+        "-p",
+        "--preroll",
+        dest="preroll",
+        type=float,
+        help="Keep This Many Seconds Of Frames In Memory And Write Them Ahead Of A TAB Recording",
+    )
+    parser.add_argument(
+        "-y",
+        "--gray",
+        dest="gray",
+        action="store_true",
+        help="Capture, Send, Track And Filter Luma Only Frames",
+    )
+    parser.add_argument(
+        "--strips",
+        dest="strips",
+        type=int,
+        help="Apply Filters On Horizontal Bands Of The Frame With This Many Threads",
+    )
+    parser.add_argument(
+        "--detection-log",
+        dest="detectionLog",
+        metavar="PATH",
+        help="Append Every Detection To A Binary Detection Log At PATH",
+    )
+    parser.add_argument(
+        "--trace",
+        dest="trace",
+        metavar="PATH",
+        help="Trace Every Frame From The Start And Save A Chrome Trace JSON Into PATH On Exit",
+    )
+    parser.add_argument(
+        "--trace-capacity",
+        dest="traceCapacity",
+        default=tracing.DEFAULT_CAPACITY,
+        type=int,
+        metavar="SPANS",
+        help="Keep The Latest SPANS Spans Of A Trace, About 200 Bytes Each",
+    )
+    parser.add_argument(
+        "-o",
+        "--offline",
+        dest="offline",
+        metavar="OUTPUT",
+        help="Process The Video File Given On 'cap' Offline In Parallel Segments And Write The Annotated Video To OUTPUT",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        help="Worker Processes For Offline Mode, Defaults To The CPU Count",
+    )
+    parser.add_argument(
+        "--filter",
+        dest="filter",
+        choices=["blur", "sharpen", "emboss", "edges"],
+        help="Filter To Apply In Offline Mode",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        default=2,
+        type=int,
+        help="Detection Workers Shared By All Sources When Several Are Given",
+    )
+    parser.add_argument(
+        "--no-preview",
+        dest="preview",
+        action="store_false",
+        help="Don't Show The Tiled Preview When Several Sources Are Given",
+    )
+    parser.add_argument(
+        "-m",
+        "--metrics",
+        dest="metrics",
+        help="Export Per-Stage Latency Metrics Periodically Into The File Given",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        dest="metricsFormat",
+        default="json",
+        choices=["json", "prometheus"],
+        help="Format For Exported Metrics, JSON Lines Or Prometheus Text File",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        dest="metricsInterval",
+        default=10.0,
+        type=float,
+        help="Seconds Between Metrics Exports",
+    )
     parser.add_argument(
         "-l",
         "--log-level",
@@ -336,7 +626,15 @@ def get_args():
 if __name__ == "__main__":
     logging.getLogger('CVServer').setLevel(logging.DEBUG)
     parser = get_args()
-    cap, label, client, classifier, address, trash, log = vars(parser.parse_args()).values()
+    args = parser.parse_args()
+    cap, label, client, classifier, address, trash, log = (
+        args.cap[0], args.label, args.client, args.classifier, args.address, args.trash, args.log
+    )
+    metrics = PipelineMetrics(
+        exportPath=args.metrics,
+        exportFormat=args.metricsFormat,
+        exportInterval=args.metricsInterval,
+    )
     try:
         import colorlog
         colorlog.basicConfig(
@@ -352,25 +650,83 @@ if __name__ == "__main__":
         )
         logging.warning('Colorlog Is Not Installed!!')
 
-    if len(cap) < 3:
+    detectOptions = dict(detect=classifier, trashold=trash)
+    options = dict(
+        metrics=metrics,
+        displayFps=args.displayFps,
+        targetFps=args.targetFps,
+        motion=args.motion,
+        preroll=args.preroll,
+        tracePath=args.trace,
+        traceCapacity=args.traceCapacity,
+        strips=args.strips,
+        detectionLog=args.detectionLog,
+    )
+    if len(args.cap) > 1:
+        from supervisor import CameoSupervisor
+
+        unsupported = [
+            flag
+            for flag, value in (
+                ("-c", client),
+                ("-i", label),
+                ("-s", address),
+                ("-o", args.offline),
+                ("-g", args.targetFps),
+                ("-p", args.preroll),
+                ("-m", args.metrics),
+                ("--strips", args.strips),
+                ("--detection-log", args.detectionLog),
+            )
+            if value
+        ]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} Can't Be Used With Several Sources")
+        CameoSupervisor(
+            args.cap,
+            workers=args.workers,
+            preview=args.preview,
+            displayFps=args.displayFps,
+            tracePath=args.trace,
+            traceCapacity=args.traceCapacity,
+            replay=args.replay,
+            rate=args.rate,
+            loop=args.loop,
+            motion=args.motion,
+            gray=args.gray,
+            **detectOptions,
+        ).run()
+        raise SystemExit
+    if args.offline:
+        from offline import processVideo
+
+        processVideo(
+            cap,
+            args.offline,
+            args.jobs,
+            filterName=args.filter,
+            motion=args.motion,
+            **detectOptions,
+        )
+        raise SystemExit
+    if len(cap) < 3 and not args.replay:
         cap = int(cap)
+    elif cap == 'csi' and args.gray:
+        # nvvidconv hands out the Y plane directly, no videoconvert needed
+        cap = 'nvarguscamerasrc sensor-id=0 ! video/x-raw(memory:NVMM),width=1024, height=768,format=NV12 ,framerate=30/1 ! nvvidconv flip-method=2 ! video/x-raw, width=640, height=480, format=GRAY8 ! appsink'
     elif cap == 'csi':
         cap = 'nvarguscamerasrc sensor-id=0 ! video/x-raw(memory:NVMM),width=1024, height=768,format=NV12 ,framerate=30/1 ! nvvidconv flip-method=2 ! video/x-raw, width=640, height=480, format=BGRx ! videoconvert ! video/x-raw, format=BGR ! appsink'
     if client and address:
         parser.error("Can't Enable Server Mode And Client Mode Same Time")
     elif client:
-        if classifier:
-            Cameo(CVClient(cap), detect=classifier, trashold=trash).run()
-        else:
-            Cameo(CVClient(cap)).run()
+        from cvclient import CVClient
+
+        Cameo(CVClient(cap), **options, **detectOptions).run()
     elif label:
-        CameoLabelTaker(cv2.VideoCapture(cap)).run()
+        CameoLabelTaker(openCapture(cap, args.replay, args.rate, args.loop, args.gray)).run()
     elif address:
-        CameoServer(cv2.VideoCapture(cap), address).run()
+        CameoServer(openCapture(cap, args.replay, args.rate, args.loop, args.gray), address, **options, **detectOptions).run()
     elif cap == 'zed':
         CameoDepth().run()
     else:
-        if classifier:
-            Cameo(cv2.VideoCapture(cap), detect=classifier, trashold=trash).run()
-        else:
-            Cameo(cv2.VideoCapture(cap)).run()
+        Cameo(openCapture(cap, args.replay, args.rate, args.loop, args.gray), **options, **detectOptions).run()
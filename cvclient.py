@@ -1,3 +1,4 @@
+import heapq
 import logging
 import pickle
 import socket
@@ -5,9 +6,13 @@ import zlib
 import struct
 import numpy
 import cv2
+import collections
 import ctypes
-import queue
 import threading
+import time
+
+import tracing
+from detections import unpackDetections
 
 HEADER_LENGTH = struct.calcsize('!BI')
 TYPE_LENGTH = 1
@@ -26,19 +31,113 @@ class Pkt(ctypes.Structure):
         ('length', ctypes.c_uint)
     ]
 
+TIMESTAMP = struct.Struct('!d')
+
+
+class JitterBuffer(object):
+    """
+    Hold received frames until their playout time.
+
+    The playout time of a frame is its sender timestamp moved onto the
+    local clock by the smallest recent transit time, plus a delay that
+    follows the measured arrival jitter. Frames arriving after a newer
+    frame was played are late, frames overtaken by a newer due frame or
+    pushed out of a full buffer are dropped.
+    """
+
+    def __init__(self, minDelay=0.0, maxDelay=0.5, jitterFactor=3.0, capacity=30, window=300):
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self.jitterFactor = jitterFactor
+        self.capacity = capacity
+        self._frames = []
+        self._condition = threading.Condition()
+        self._transits = collections.deque(maxlen=window)
+        self._offset = None
+        self._lastTransit = None
+        self._jitter = 0.0
+        self._lastPlayed = None
+        self.late = 0
+        self.dropped = 0
+        self.played = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def delay(self):
+        return min(self.maxDelay, max(self.minDelay, self.jitterFactor * self._jitter))
+
+    def _playoutTime(self, senderTime):
+        return senderTime + self._offset + self.delay
+
+    def put(self, senderTime, data, arrival=None):
+        arrival = time.perf_counter() if arrival is None else arrival
+        transit = arrival - senderTime
+        with self._condition:
+            if self._lastTransit is not None:
+                # Interarrival jitter estimate of RFC 3550.
+                self._jitter += (abs(transit - self._lastTransit) - self._jitter) / 16
+            self._lastTransit = transit
+            self._transits.append(transit)
+            self._offset = min(self._transits)
+            if self._lastPlayed is not None and senderTime <= self._lastPlayed:
+                self.late += 1
+                return
+            heapq.heappush(self._frames, (senderTime, data))
+            while len(self._frames) > self.capacity:
+                heapq.heappop(self._frames)
+                self.dropped += 1
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Return the data of the next due frame, or None if no frame is
+        due within timeout seconds.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._condition:
+            while True:
+                now = time.perf_counter()
+                wait = None if deadline is None else deadline - now
+                if self._frames:
+                    due = self._playoutTime(self._frames[0][0]) - now
+                    if due <= 0:
+                        senderTime, data = heapq.heappop(self._frames)
+                        while self._frames and self._playoutTime(self._frames[0][0]) <= now:
+                            senderTime, data = heapq.heappop(self._frames)
+                            self.dropped += 1
+                        self._lastPlayed = senderTime
+                        self.played += 1
+                        return data
+                    wait = due if wait is None else min(wait, due)
+                if wait is not None and wait <= 0:
+                    return None
+                self._condition.wait(wait)
+
+
 class CVClient:
 
     def __init__(
-        self, host="localhost", port=9999, logger="CVClient"
+        self, host="localhost", port=9999, grabTimeout=None, serverTimeout=2.0, logger="CVClient"
     ):
+        """
+        grab() waits at most grabTimeout seconds for a due frame, forever
+        if None. The server counts as gone after serverTimeout seconds
+        without a datagram.
+        """
         self._logger = logging.getLogger(logger)
         self._logger.debug(f"Initial Class {logger}")
         self.server_address = (host, port)
-        self._queue = queue.Queue()
+        self.grabTimeout = grabTimeout
+        self.serverTimeout = serverTimeout
+        self._buffer = JitterBuffer()
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._socket.settimeout(5)
         self._connection_established = False
+        self._grabed = False
         self._id = None
+        self.detections = None
         self.connect()
 
     def disconnect(self):
@@ -56,6 +155,7 @@ class CVClient:
                 self._id = struct.unpack('!d', self._socket.recvfrom(header.length)[0])[0]
                 self._logger.info(f"Connected To {self.server_address[0]}:{self.server_address[1]} With {self._id} ID")
                 self._connection_established = True
+                self._socket.settimeout(self.serverTimeout)
                 threading.Thread(target=self._recv, daemon=True).start()
                 return True
 
@@ -70,6 +170,14 @@ class CVClient:
     def is_connected(self):
         return self._connection_established
 
+    @property
+    def late(self):
+        return self._buffer.late
+
+    @property
+    def dropped(self):
+        return self._buffer.dropped
+
     def _recv(self):
         while self.is_connected:
             try:
@@ -80,13 +188,17 @@ class CVClient:
                     self._connection_established = False
                 
                 elif header.type == TY_FRAME:
+                    start = time.perf_counter()
                     data, _ = self._socket.recvfrom(header.length)
                     while header.length > len(data):
                         data += self._socket.recvfrom(header.length - len(data))[0]
                     self._logger.debug(f"Received Frame Has {header.length//1024}K Size ")
-                    self._queue.put(data)
-                    self._socket.sendto(struct.pack('!BdI', TY_FRAME_OK, self._id, 0), self.server_address)
+                    self._buffer.put(TIMESTAMP.unpack_from(data)[0], memoryview(data)[TIMESTAMP.size:])
+                    tracing.complete("recv", start, time.perf_counter())
+                    with tracing.span("send"):
+                        self._socket.sendto(struct.pack('!BdI', TY_FRAME_OK, self._id, 0), self.server_address)
             except socket.timeout:
+                self._logger.warning(f"Server Silent For {self.serverTimeout}s, Disconnect")
                 self._connection_established = False
         else:
             self._socket.close()
@@ -99,27 +211,43 @@ class CVClient:
     def isOpened(self):
         return self.is_connected
 
-    def grab(self, *args, **kwargs):
-        if self.is_connected:
-            self._frame_buffer = self._queue.get()
-            self._grabed = True
+    def grab(self, timeout=None):
+        """
+        Take the next due frame of the jitter buffer.
+
+        Returns False when no frame is due within timeout seconds, which
+        defaults to grabTimeout, or when the server is gone.
+        """
+        timeout = self.grabTimeout if timeout is None else timeout
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        self._grabed = False
+        while self.is_connected:
+            # Wake up regularly to notice a dead server.
+            wait = 0.1 if deadline is None else min(0.1, max(0.0, deadline - time.perf_counter()))
+            data = self._buffer.get(wait)
+            if data is not None:
+                self._frame_buffer = data
+                self._grabed = True
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
         return self._grabed
 
     def retrieve(self, *args, **kwargs):
         if self._grabed:
             try:
-                frame_data = numpy.frombuffer(
-                    zlib.decompress(self._frame_buffer),
-                    dtype=numpy.uint8,
-                )
+                payload, self.detections = unpackDetections(zlib.decompress(self._frame_buffer))
+                frame_data = numpy.frombuffer(payload, dtype=numpy.uint8)
             except zlib.error:
                 self._logger.debug("Can't retrieve Frame. Decompress Error")
-                return None, numpy.empty([0, 0], dtype=numpy.uint8)
-            frame = cv2.imdecode(frame_data, cv2.IMREAD_UNCHANGED)
+                self._grabed = False
+                return False, None
+            with tracing.span("decode"):
+                frame = cv2.imdecode(frame_data, cv2.IMREAD_UNCHANGED)
             self._grabed = False
             return True, frame
-        
-        return None, numpy.empty([0, 0], dtype=numpy.uint8)
+
+        return False, None
 
     def read(self, *args, **kwargs):
         self.grab()
@@ -129,6 +257,9 @@ class CVClient:
         return None
 
     def release(self):
+        self._logger.info(
+            f"Played {self._buffer.played} Frames, {self._buffer.late} Late, {self._buffer.dropped} Dropped"
+        )
         if self.is_connected:
             self._socket.sendto(struct.pack('!BdI', TY_CLOSE, self._id, 0), self.server_address)
             self._socket.close()
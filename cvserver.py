@@ -12,6 +12,9 @@ import threading
 import random
 import ctypes
 
+import tracing
+from detections import packDetections
+
 HEADER_LENGTH = struct.calcsize('!BdI')
 TYPE_LENGTH = 1
 CHUNK_SIZE = 50000
@@ -31,7 +34,7 @@ class Pkt(ctypes.Structure):
     ]
 
 class CVServer(object):
-    def __init__(self, host="0.0.0.0", port=9999, logger="CVServer"):
+    def __init__(self, host="0.0.0.0", port=9999, metrics=None, logger="CVServer"):
         self._logger = logging.getLogger(logger)
         self._logger.debug(f"Initial Class {logger}")
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -41,6 +44,8 @@ class CVServer(object):
         self._client = {}
         self._is_running = False
         self._queue = queue.Queue()
+        self._threads = []
+        self.metrics = metrics
 
     @property
     def is_running(self):
@@ -55,19 +60,37 @@ class CVServer(object):
         self._socket.bind((self.host, self.port))
         self._logger.info(f"Start Lisining Into {self.host}:{self.port}")
         self._is_running = True
-        threading.Thread(target=self._recv, daemon=True).start()
-        threading.Thread(target=self._send, daemon=True).start()
+        self._threads = [
+            threading.Thread(target=self._recv, daemon=True),
+            threading.Thread(target=self._send, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
 
     def stop_server(self):
+        """
+        Tell the client, then wait for both threads before closing the socket.
+        """
+        if not self._is_running:
+            return
         if len(self._client):
             self._socket.sendto(struct.pack('!BI', TY_CLOSE, 0), self._client.get('address'))
         self._is_running = False
-        self._client_id = {}
+        # Wakes _send out of its wait for a frame.
+        self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._socket.close()
+        self._client = {}
 
     def _recv(self):
         self._logger.debug(f"Wait Client To Connect...")
         while self.is_running:
+            # Times out so that stop_server isn't left waiting for a packet.
+            if not select.select([self._socket], [], [], 0.1)[0]:
+                continue
             data, info = self._socket.recvfrom(HEADER_LENGTH)
+            start = time.perf_counter()
             header = Pkt(*struct.unpack('!BdI', data))
             if header.type == TY_OPEN and not len(self._client):
                 self._logger.info(f"Accepted Client From {info[0]}:{info[1]}")
@@ -83,17 +106,33 @@ class CVServer(object):
             
             elif self._client.get('id') == header.id and header.type == TY_FRAME_OK:
                 self._continue_send = True
-        else:
-            self._socket.close()
+            tracing.complete("recv", start, time.perf_counter())
+
 
 
+    def send_frame(self, frame, detections=None, timestamp=None):
+        """
+        Queue a frame, and optionally its detections, for the client.
 
-    def send_frame(self, frame):
+        The client plays frames out on their timestamp, the
+        time.perf_counter() at which the frame was captured. It defaults
+        to the time of this call.
+        """
         if self.is_connected:
+            start = time.perf_counter()
+            if timestamp is None:
+                timestamp = start
             ret, encoded_frame = cv2.imencode(
                 ".jpeg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 90]
             )
-            self._queue.put(encoded_frame.tobytes())
+            end = time.perf_counter()
+            if self.metrics is not None:
+                self.metrics.record("encode", end - start, end)
+            tracing.complete("encode", start, end)
+            data = encoded_frame.tobytes()
+            if detections is not None:
+                data += packDetections(detections)
+            self._queue.put((timestamp, data))
 
 
     def _send(self):
@@ -102,18 +141,24 @@ class CVServer(object):
             try:
                 if self._continue_send:
                     self._continue_send = False
-                    frame = self._queue.get()
-                    compressed = zlib.compress(frame)
+                    item = self._queue.get()
+                    if item is None:
+                        break
+                    timestamp, frame = item
+                    start = time.perf_counter()
+                    compressed = struct.pack("!d", timestamp) + zlib.compress(frame)
                     header = struct.pack("!BI", TY_FRAME, len(compressed))
                     chunks = [compressed[i:i+CHUNK_SIZE] for i in range(0, len(compressed), CHUNK_SIZE)]
                     self._socket.sendto(header, self._client.get('address'))
                     for chunk in chunks:
                         self._socket.sendto(chunk, socket.MSG_DONTWAIT, self._client.get('address'))
+                    end = time.perf_counter()
+                    if self.metrics is not None:
+                        self.metrics.record("send", end - start, end)
+                    tracing.complete("send", start, end)
 
             except Exception as e:
                 self._logger.error(e)
-        else:
-            self._socket.close()
 
     def __del__(self):
         if len(self._client):
@@ -0,0 +1,255 @@
+import argparse
+import json
+import logging
+import os
+
+import cv2
+import numpy
+
+import utils
+
+METADATA_FILENAME = "dataset.json"
+INDEX_FILENAME = "index.npy"
+
+INDEX_DTYPE = numpy.dtype(
+    [
+        ("shard", "<u4"),
+        ("offset", "<u8"),
+        ("length", "<u4"),
+        ("label", "<i4"),
+        ("x", "<i4"),
+        ("y", "<i4"),
+        ("w", "<i4"),
+        ("h", "<i4"),
+    ]
+)
+
+NEGATIVE = 0
+POSITIVE = 1
+
+
+def shardFilename(dirname, shard):
+    return os.path.join(dirname, f"shard-{shard:05d}.bin")
+
+
+class ShardWriter(object):
+    """
+    Pack labeled samples into fixed-size shards plus one index.
+
+    In "encoded" mode a shard holds concatenated encoded images (JPEG
+    files are copied as they are), in "gray" mode it holds grayscale
+    arrays resized to size. The index keeps shard, offset, length, label
+    and rect of every sample.
+    """
+
+    def __init__(self, dirname, mode="encoded", size=(24, 24), samplesPerShard=4096, logger="ShardWriter"):
+        self._logger = logging.getLogger(logger)
+        self._logger.debug(f"Initial Class {logger}")
+        if mode not in ("encoded", "gray"):
+            raise ValueError(f"Unknown dataset mode {mode}")
+        os.makedirs(dirname, exist_ok=True)
+        self.dirname = dirname
+        self.mode = mode
+        self.size = tuple(size)
+        self.samplesPerShard = samplesPerShard
+        self._rows = []
+        self._shard = -1
+        self._shardFile = None
+        self._offset = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _nextShard(self):
+        if self._shardFile is not None:
+            self._shardFile.close()
+        self._shard += 1
+        self._shardFile = open(shardFilename(self.dirname, self._shard), "wb")
+        self._offset = 0
+
+    def add(self, image, label, rect=None):
+        """
+        Add an image array, or encoded image bytes in "encoded" mode.
+
+        In "gray" mode positives are cropped to rect, clipped to the image,
+        before resizing, and their stored rect spans the resized sample.
+        Returns False, without adding it, for a rect outside the image.
+        """
+        if self.mode == "gray":
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                image = cv2.imdecode(numpy.frombuffer(image, numpy.uint8), cv2.IMREAD_GRAYSCALE)
+            elif not utils.isGray(image):
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            if rect is not None and rect[2] > 0 and rect[3] > 0:
+                # Store the object itself, its rect then covers the whole sample.
+                x, y, w, h = rect
+                height, width = image.shape[:2]
+                x0, y0, x1, y1 = max(0, x), max(0, y), min(width, x + w), min(height, y + h)
+                if x1 <= x0 or y1 <= y0:
+                    self._logger.warning(f"Skip Sample, Rect {tuple(rect)} Is Outside The {width}x{height} Image")
+                    return False
+                image = image[y0:y1, x0:x1]
+                rect = (0, 0) + self.size
+            data = cv2.resize(image, self.size).tobytes()
+        elif isinstance(image, (bytes, bytearray, memoryview)):
+            data = bytes(image)
+        else:
+            data = cv2.imencode(".jpg", image)[1].tobytes()
+        if len(self._rows) % self.samplesPerShard == 0:
+            self._nextShard()
+        self._shardFile.write(data)
+        x, y, w, h = rect if rect is not None else (0, 0, 0, 0)
+        self._rows.append((self._shard, self._offset, len(data), label, x, y, w, h))
+        self._offset += len(data)
+        return True
+
+    def close(self):
+        if self._shardFile is not None:
+            self._shardFile.close()
+            self._shardFile = None
+        numpy.save(os.path.join(self.dirname, INDEX_FILENAME), numpy.array(self._rows, dtype=INDEX_DTYPE))
+        with open(os.path.join(self.dirname, METADATA_FILENAME), "w") as file:
+            json.dump(
+                {
+                    "mode": self.mode,
+                    "size": list(self.size),
+                    "samplesPerShard": self.samplesPerShard,
+                    "shards": self._shard + 1,
+                    "samples": len(self._rows),
+                },
+                file,
+            )
+        self._logger.info(f"Wrote {len(self._rows)} Samples In {self._shard + 1} Shards")
+
+
+class ShardReader(object):
+    """
+    Iterate or randomly sample a sharded dataset through memory maps.
+
+    Items are (image, label, rect) tuples; images of a "gray" dataset are
+    zero-copy views, images of an "encoded" dataset are decoded on access.
+    """
+
+    def __init__(self, dirname, flags=cv2.IMREAD_UNCHANGED):
+        self.dirname = dirname
+        self.flags = flags
+        with open(os.path.join(dirname, METADATA_FILENAME)) as file:
+            metadata = json.load(file)
+        self.mode = metadata["mode"]
+        self.size = tuple(metadata["size"])
+        self.index = numpy.load(os.path.join(dirname, INDEX_FILENAME))
+        self._shards = [
+            numpy.memmap(shardFilename(dirname, shard), numpy.uint8, "r")
+            if os.path.getsize(shardFilename(dirname, shard)) else numpy.empty(0, numpy.uint8)
+            for shard in range(metadata["shards"])
+        ]
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def labels(self):
+        return self.index["label"]
+
+    @property
+    def rects(self):
+        return numpy.column_stack([self.index[key] for key in ("x", "y", "w", "h")])
+
+    def raw(self, index):
+        """
+        Return the stored bytes of a sample as a memmap view.
+        """
+        row = self.index[index]
+        offset = int(row["offset"])
+        return self._shards[row["shard"]][offset : offset + int(row["length"])]
+
+    def image(self, index):
+        data = self.raw(index)
+        if self.mode == "gray":
+            return data.reshape(self.size[1], self.size[0])
+        return cv2.imdecode(data, self.flags)
+
+    def __getitem__(self, index):
+        row = self.index[index]
+        return self.image(index), int(row["label"]), (int(row["x"]), int(row["y"]), int(row["w"]), int(row["h"]))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def sample(self, count, seed=None, chunkSize=1024):
+        """
+        Yield count samples drawn uniformly without replacement, in random
+        order.
+
+        At most chunkSize samples are held at a time: the drawn indices are
+        read chunk by chunk, each in storage order, and yielded shuffled.
+        """
+        rng = numpy.random.default_rng(seed)
+        indices = rng.choice(len(self), size=min(count, len(self)), replace=False)
+        for start in range(0, len(indices), chunkSize):
+            # Read in storage order to keep I/O sequential, then yield shuffled.
+            samples = [self[index] for index in numpy.sort(indices[start : start + chunkSize])]
+            for position in rng.permutation(len(samples)):
+                yield samples[position]
+
+
+def exportSampleStore(sampleDir, datasetDir, mode="encoded", size=(24, 24), samplesPerShard=4096):
+    """
+    Pack the samples listed in a SampleStore manifest into shards.
+    """
+    writer = ShardWriter(datasetDir, mode, size, samplesPerShard)
+    with open(os.path.join(sampleDir, "manifest.txt")) as manifest:
+        for line in manifest:
+            fields = line.split()
+            kind, name = fields[:2]
+            path = os.path.join(sampleDir, name)
+            if not os.path.exists(path):
+                continue
+            rect = None
+            if kind == "positive":
+                if len(fields) < 7:
+                    with open(f"{os.path.splitext(path)[0]}.txt") as label:
+                        fields = fields[:2] + label.read().split()
+                rect = tuple(int(value) for value in fields[3:7])
+            with open(path, "rb") as file:
+                writer.add(file.read(), POSITIVE if kind == "positive" else NEGATIVE, rect)
+    writer.close()
+    return writer
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Pack labeled samples taken with 'cameo.py -i' into dataset shards."
+    )
+    parser.add_argument("source", help="Sample directory with a manifest.txt")
+    parser.add_argument("destination", help="Directory to write the shards into")
+    parser.add_argument(
+        "-g",
+        "--gray",
+        dest="gray",
+        metavar="WxH",
+        help="Store grayscale arrays resized to WxH instead of encoded images",
+    )
+    parser.add_argument(
+        "-n",
+        "--samples-per-shard",
+        dest="samplesPerShard",
+        default=4096,
+        type=int,
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="[%(asctime)s.%(msecs)03d] [%(levelname)s] (%(name)s): %(message)s",
+        level=logging.INFO,
+        datefmt="%H:%M:%S",
+    )
+    args = get_args().parse_args()
+    if args.gray:
+        size = tuple(int(value) for value in args.gray.lower().split("x"))
+        exportSampleStore(args.source, args.destination, "gray", size, args.samplesPerShard)
+    else:
+        exportSampleStore(args.source, args.destination, samplesPerShard=args.samplesPerShard)
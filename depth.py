@@ -1,17 +1,157 @@
+import math
+
 import numpy
 import cv2
 
 
-def createMedianMask(disparityMap, validDepthMask, rect=None):
+def _histogramMedian(image):
+    """
+    Return the median of an 8-bit or 16-bit image from its histogram.
+    """
+    bins = 256 if image.dtype == numpy.uint8 else 65536
+    hist = cv2.calcHist([image], [0], None, [bins], [0, bins]).ravel()
+    cumulative = numpy.cumsum(hist, dtype=numpy.float64)
+    count = cumulative[-1]
+    lower = numpy.searchsorted(cumulative, (count - 1) // 2, side="right")
+    upper = numpy.searchsorted(cumulative, count // 2, side="right")
+    return (lower + upper) / 2
+
+
+def _writeMedianMask(disparityMap, validDepthMask, dst, threshold):
+    if disparityMap.dtype in (numpy.uint8, numpy.uint16):
+        median = _histogramMedian(disparityMap)
+        # |d - median| < threshold over integers, without leaving the dtype.
+        lower = math.floor(median - threshold) + 1
+        upper = math.ceil(median + threshold) - 1
+        cv2.inRange(disparityMap, lower, upper, dst)
+    else:
+        median = numpy.median(disparityMap)
+        numpy.less(numpy.abs(disparityMap - median), threshold, out=dst, casting="unsafe")
+        dst *= 255
+    cv2.bitwise_or(dst, cv2.inRange(validDepthMask, 0, 0), dst)
+    return dst
+
+
+def _outputBuffer(dst, shape):
+    if dst is None or dst.shape != shape or dst.dtype != numpy.uint8:
+        return numpy.empty(shape, dtype=numpy.uint8)
+    return dst
+
+
+def createMedianMask(disparityMap, validDepthMask, rect=None, dst=None, threshold=12):
     """
     Return a mask selecting the median layer, plus shadows.
+
+    The mask is uint8 with 0 or 255 and is written into dst when dst has
+    the right shape, so the same buffer can be reused every frame.
     """
     if rect is not None:
         x, y, w, h = rect
         disparityMap = disparityMap[y : y + h, x : x + w]
         validDepthMask = validDepthMask[y : y + h, x : x + w]
-    median = numpy.median(disparityMap)
-    return numpy.where(
-        (validDepthMask == 0) | (abs(disparityMap - median) < 12), 255, 0
-    )  # feel this value with your particular camera setup
+    dst = _outputBuffer(dst, disparityMap.shape[:2])
+    # feel the threshold with your particular camera setup
+    return _writeMedianMask(disparityMap, validDepthMask, dst, threshold)
+
+
+def createMedianMasks(disparityMap, validDepthMask, rects, dst=None, threshold=12):
+    """
+    Return one full-size mask holding the median layer of each rect.
+
+    Every rect gets its own median, pixels outside all rects are 0.
+    """
+    dst = _outputBuffer(dst, disparityMap.shape[:2])
+    dst[:] = 0
+    height, width = disparityMap.shape[:2]
+    for x, y, w, h in rects:
+        x0, y0 = max(int(x), 0), max(int(y), 0)
+        x1, y1 = min(int(x + w), width), min(int(y + h), height)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        roiMask = _writeMedianMask(
+            disparityMap[y0:y1, x0:x1],
+            validDepthMask[y0:y1, x0:x1],
+            numpy.empty((y1 - y0, x1 - x0), dtype=numpy.uint8),
+            threshold,
+        )
+        roi = dst[y0:y1, x0:x1]
+        cv2.bitwise_or(roi, roiMask, roi)
+    return dst
+
+
+class DepthQuery(object):
+    """
+    Distance lookups over one depth map, computed once per frame.
+
+    Values that are not finite, not positive or outside
+    [minDepth, maxDepth] are treated as invalid. Results are multiplied
+    by scale, e.g. 0.001 for a millimeter map queried in meters.
+    """
+
+    def __init__(self, depthMap, scale=1.0, minDepth=None, maxDepth=None):
+        self.depthMap = depthMap
+        self.scale = scale
+        self.minDepth = minDepth
+        self.maxDepth = maxDepth
+
+    def _validMask(self, values):
+        valid = numpy.isfinite(values) & (values > 0)
+        if self.minDepth is not None:
+            valid &= values >= self.minDepth
+        if self.maxDepth is not None:
+            valid &= values <= self.maxDepth
+        return valid
+
+    def distance(self, x, y):
+        value = float(self.depthMap[y, x])
+        if not self._validMask(numpy.array(value)):
+            return None
+        return value * self.scale
+
+    def rectDistances(self, rects, percentile=50, samples=None):
+        """
+        Return the percentile of valid depth inside each (x, y, w, h) rect.
 
+        Rects are clipped to the map and the percentile is taken over all
+        of their valid pixels. With samples, each rect is instead sampled
+        on a samples x samples grid, so the cost does not depend on rect
+        size, at the price of an estimate. Rects without valid depth get
+        NaN.
+        """
+        rects = numpy.asarray(rects, dtype=numpy.float64).reshape(-1, 4)
+        if len(rects) == 0:
+            return numpy.empty(0, dtype=numpy.float64)
+        height, width = self.depthMap.shape[:2]
+        left = numpy.clip(rects[:, 0], 0, width).astype(numpy.intp)
+        top = numpy.clip(rects[:, 1], 0, height).astype(numpy.intp)
+        right = numpy.clip(rects[:, 0] + rects[:, 2], 0, width).astype(numpy.intp)
+        bottom = numpy.clip(rects[:, 1] + rects[:, 3], 0, height).astype(numpy.intp)
+        if samples is None:
+            distances = numpy.full(len(rects), numpy.nan)
+            for index, (x0, y0, x1, y1) in enumerate(zip(left, top, right, bottom)):
+                values = self.depthMap[y0:y1, x0:x1]
+                values = values[self._validMask(values)]
+                if len(values):
+                    distances[index] = numpy.percentile(values, percentile)
+            return distances * self.scale
+        steps = (numpy.arange(samples) + 0.5) / samples
+        xs = left[:, numpy.newaxis] + steps * (right - left)[:, numpy.newaxis]
+        ys = top[:, numpy.newaxis] + steps * (bottom - top)[:, numpy.newaxis]
+        xs = numpy.clip(xs.astype(numpy.intp), 0, width - 1)
+        ys = numpy.clip(ys.astype(numpy.intp), 0, height - 1)
+        values = self.depthMap[ys[:, :, numpy.newaxis], xs[:, numpy.newaxis, :]]
+        values = values.reshape(len(rects), -1).astype(numpy.float64)
+        valid = self._validMask(values)
+        valid &= ((right > left) & (bottom > top))[:, numpy.newaxis]
+        values[~valid] = numpy.nan
+        # NaNs sort last, so the valid samples lead every row.
+        values.sort(axis=1)
+        counts = valid.sum(axis=1)
+        position = (percentile / 100) * numpy.maximum(counts - 1, 0)
+        lower = numpy.floor(position).astype(numpy.intp)
+        upper = numpy.ceil(position).astype(numpy.intp)
+        lowerValues = numpy.take_along_axis(values, lower[:, numpy.newaxis], 1)[:, 0]
+        upperValues = numpy.take_along_axis(values, upper[:, numpy.newaxis], 1)[:, 0]
+        distances = lowerValues + (upperValues - lowerValues) * (position - lower)
+        distances[counts == 0] = numpy.nan
+        return distances * self.scale
@@ -0,0 +1,172 @@
+import logging
+import os
+import time
+
+import numpy
+
+from detections import DETECTION_DTYPE
+
+RECORD_DTYPE = numpy.dtype(
+    [
+        ("frame", "<u8"),
+        ("timestamp", "<f8"),
+        ("label", "<i4"),
+        ("rect", "<i4", (4,)),
+        ("score", "<f4"),
+    ]
+)
+
+INDEX_DTYPE = numpy.dtype(
+    [
+        ("timestamp", "<f8"),
+        ("record", "<u8"),
+    ]
+)
+
+
+def indexFilename(filename):
+    return f"{filename}.idx"
+
+
+class DetectionLogWriter(object):
+    """
+    Append detections as fixed-size records to a binary log file.
+
+    Records are buffered and written in batches of batchSize records, or
+    after flushInterval seconds. Each batch adds one (timestamp, record)
+    row to the sparse index next to the log. Opening an existing log
+    appends to it.
+    """
+
+    def __init__(self, filename, batchSize=256, flushInterval=1.0, logger="DetectionLogWriter"):
+        self._logger = logging.getLogger(logger)
+        self._logger.debug(f"Initial Class {logger}")
+        self.filename = filename
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self._file = None
+        self._indexFile = None
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        if size % RECORD_DTYPE.itemsize:
+            # Drop the partial record of an interrupted write.
+            size -= size % RECORD_DTYPE.itemsize
+            os.truncate(filename, size)
+        self._count = size // RECORD_DTYPE.itemsize
+        self._truncateIndex()
+        self._file = open(filename, "ab")
+        self._indexFile = open(indexFilename(filename), "ab")
+        self._batch = []
+        self._pending = 0
+        self._lastFlush = time.perf_counter()
+
+    def _truncateIndex(self):
+        """
+        Cut the index back to its whole rows that point into the log.
+        """
+        filename = indexFilename(self.filename)
+        if not os.path.exists(filename):
+            return
+        index = numpy.fromfile(filename, INDEX_DTYPE, os.path.getsize(filename) // INDEX_DTYPE.itemsize)
+        # Rows are ascending, the valid ones are a prefix.
+        rows = int(numpy.searchsorted(index["record"], self._count))
+        if rows * INDEX_DTYPE.itemsize != os.path.getsize(filename):
+            self._logger.warning(f"Truncate Index {filename} To {rows} Rows")
+            os.truncate(filename, rows * INDEX_DTYPE.itemsize)
+
+    def __len__(self):
+        return self._count + self._pending
+
+    def append(self, detections, timestamp=None):
+        """
+        Buffer DETECTION_DTYPE rows, stamped with timestamp or now.
+        """
+        detections = numpy.asarray(detections, dtype=DETECTION_DTYPE)
+        if len(detections):
+            records = numpy.empty(len(detections), dtype=RECORD_DTYPE)
+            records["frame"] = detections["frame"]
+            records["timestamp"] = time.time() if timestamp is None else timestamp
+            records["label"] = detections["label"]
+            records["rect"] = detections["rect"]
+            records["score"] = detections["score"]
+            self._batch.append(records)
+            self._pending += len(records)
+        if self._pending >= self.batchSize or time.perf_counter() - self._lastFlush >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        self._lastFlush = time.perf_counter()
+        if not self._pending or self._file is None:
+            return
+        batch = numpy.concatenate(self._batch)
+        self._file.write(batch.tobytes())
+        self._file.flush()
+        # The index row is written after its records, so it never points past the log.
+        self._indexFile.write(numpy.array([(batch["timestamp"][0], self._count)], INDEX_DTYPE).tobytes())
+        self._indexFile.flush()
+        self._count += len(batch)
+        self._batch = []
+        self._pending = 0
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._logger.info(f"Close Detection Log {self.filename} With {self._count} Records")
+        self._file.close()
+        self._indexFile.close()
+        self._file = None
+        self._indexFile = None
+
+    def __del__(self):
+        if getattr(self, "_file", None) is not None:
+            self.close()
+
+
+class DetectionLogReader(object):
+    """
+    Query a detection log through a read-only numpy.memmap.
+
+    Results are RECORD_DTYPE arrays, zero-copy views of the log where
+    possible. Records are in append order, so timestamps are ascending.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        count = os.path.getsize(filename) // RECORD_DTYPE.itemsize
+        if count:
+            self.records = numpy.memmap(filename, RECORD_DTYPE, "r", shape=(count,))
+        else:
+            self.records = numpy.zeros(0, dtype=RECORD_DTYPE)
+        index = numpy.zeros(0, dtype=INDEX_DTYPE)
+        if os.path.exists(indexFilename(filename)):
+            size = os.path.getsize(indexFilename(filename)) // INDEX_DTYPE.itemsize
+            index = numpy.fromfile(indexFilename(filename), INDEX_DTYPE, size)
+        self.index = index[index["record"] < count]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    @property
+    def timestamps(self):
+        return self.records["timestamp"]
+
+    def between(self, start, stop, label=None):
+        """
+        Return the records with start <= timestamp < stop.
+
+        The sparse index narrows the search to the batches overlapping the
+        range, so only those pages of the log are touched.
+        """
+        first = numpy.searchsorted(self.index["timestamp"], start, "right") - 1
+        last = numpy.searchsorted(self.index["timestamp"], stop, "right")
+        begin = int(self.index["record"][first]) if first >= 0 else 0
+        end = int(self.index["record"][last]) if last < len(self.index) else len(self.records)
+        chunk = self.records[begin:end]
+        timestamps = chunk["timestamp"]
+        chunk = chunk[numpy.searchsorted(timestamps, start) : numpy.searchsorted(timestamps, stop)]
+        if label is not None:
+            chunk = chunk[chunk["label"] == label]
+        return chunk
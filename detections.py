@@ -0,0 +1,76 @@
+import struct
+
+import numpy
+
+import utils
+
+FACE = 0
+OBJECT = 1
+
+DETECTION_DTYPE = numpy.dtype(
+    [
+        ("label", "<i4"),
+        ("rect", "<i4", (4,)),
+        ("leftEye", "<i4", (4,)),
+        ("rightEye", "<i4", (4,)),
+        ("score", "<f4"),
+        ("frame", "<u8"),
+    ]
+)
+
+TRAILER = struct.Struct("!I4s")
+TRAILER_MAGIC = b"CDET"
+
+COLORS = {
+    "rect": (255, 255, 255),
+    "leftEye": (0, 0, 255),
+    "rightEye": (0, 255, 255),
+}
+
+
+def makeDetections(rects, label, frame=0, scores=None):
+    """
+    Return one detection row per (x, y, w, h) rect. Eye rects start
+    empty, a rect with zero width marks a missing rect.
+    """
+    rects = numpy.asarray(rects, dtype=numpy.int32).reshape(-1, 4)
+    detections = numpy.zeros(len(rects), dtype=DETECTION_DTYPE)
+    detections["label"] = label
+    detections["rect"] = rects
+    detections["frame"] = frame
+    if scores is not None:
+        detections["score"] = numpy.asarray(scores, dtype=numpy.float32).reshape(-1)
+    return detections
+
+
+def drawDetections(image, detections, fields=("rect", "leftEye", "rightEye"), colors=COLORS):
+    gray = utils.isGray(image)
+    for field in fields:
+        color = 255 if gray else colors.get(field, (255, 255, 255))
+        for rect in detections[field][detections[field][:, 2] > 0].tolist():
+            utils.outlineRect(image, rect, color)
+
+
+def packDetections(detections):
+    """
+    Serialize detections into bytes that end with a count and magic trailer.
+    """
+    detections = numpy.ascontiguousarray(detections, dtype=DETECTION_DTYPE)
+    return detections.tobytes() + TRAILER.pack(len(detections), TRAILER_MAGIC)
+
+
+def unpackDetections(payload):
+    """
+    Split payload into the leading bytes and trailing packed detections.
+
+    Returns (payload, None) when payload carries no detections.
+    """
+    if len(payload) < TRAILER.size:
+        return payload, None
+    count, magic = TRAILER.unpack_from(payload, len(payload) - TRAILER.size)
+    size = count * DETECTION_DTYPE.itemsize
+    if magic != TRAILER_MAGIC or size + TRAILER.size > len(payload):
+        return payload, None
+    start = len(payload) - TRAILER.size - size
+    detections = numpy.frombuffer(payload, DETECTION_DTYPE, count, start)
+    return payload[:start], detections
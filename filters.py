@@ -1,22 +1,46 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy
 import utils
 
+_executors = {}
+
 
 def strokeEdges(src, dst, blurKsize=7, edgeKsize=5):
+    gray = utils.isGray(src)
     if blurKsize >= 3:
         blurredSrc = cv2.medianBlur(src, blurKsize)
-        graySrc = cv2.cvtColor(blurredSrc, cv2.COLOR_BGR2GRAY)
+        graySrc = blurredSrc if gray else cv2.cvtColor(blurredSrc, cv2.COLOR_BGR2GRAY)
     else:
-        graySrc = cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
+        graySrc = src.copy() if gray else cv2.cvtColor(src, cv2.COLOR_BGR2GRAY)
+    graySrc = graySrc.reshape(src.shape[:2])
     cv2.Laplacian(graySrc, cv2.CV_8U, graySrc, ksize=edgeKsize)
     normalized = (1 / 255) * (255 - graySrc)
+    if gray:
+        dst.reshape(src.shape[:2])[:] = src.reshape(src.shape[:2]) * normalized
+        return
     channels = cv2.split(src)
     for channel in channels:
         channel[:] = channel * normalized
     cv2.merge(channels, dst)
 
 
+class StrokeEdgesFilter(object):
+    """
+    strokeEdges as a filter object.
+    """
+
+    def __init__(self, blurKsize=7, edgeKsize=5):
+        self.blurKsize = blurKsize
+        self.edgeKsize = edgeKsize
+        self.overlap = (blurKsize // 2 if blurKsize >= 3 else 0) + edgeKsize // 2
+
+    def apply(self, src, dst):
+        strokeEdges(src, dst, self.blurKsize, self.edgeKsize)
+
+
 class VConvolutionFilter(object):
     """
     A filter that applies a convolution to V (or all of BGR).
@@ -24,6 +48,7 @@ class VConvolutionFilter(object):
 
     def __init__(self, kernel):
         self._kernel = kernel
+        self.overlap = max(kernel.shape) // 2
 
     def apply(self, src, dst):
         """
@@ -73,3 +98,63 @@ class EmpossFilter(VConvolutionFilter):
         kernel = numpy.array([[-2, -1, 0], [-1, 1, 1], [0, 1, 2]])
         super().__init__(kernel)
 
+
+class StripScheduler(object):
+    """
+    Run a filter on horizontal bands of the frame in a thread pool.
+
+    Each band reads overlap extra rows above and below, the radius the
+    filter declares in its overlap attribute, so the result matches a
+    whole-frame apply. Filters without an overlap are taken as pointwise
+    and write straight into views of dst.
+
+    Filters with an overlap write each band into a scratch buffer, kept
+    across calls for the frame size, and the band's rows are copied into
+    dst once every band has run. That copy of the frame is the only one:
+    src is read in place, in-place applies included, since dst is not
+    written while bands still read their neighbours' rows.
+    """
+
+    def __init__(self, curveFilter, workers=None, minRows=64):
+        self.filter = curveFilter
+        self.overlap = getattr(curveFilter, "overlap", 0)
+        self.workers = workers or os.cpu_count() or 1
+        self.minRows = minRows
+        self._key = None
+        self._scratch = []
+        if self.workers not in _executors:
+            _executors[self.workers] = ThreadPoolExecutor(self.workers, thread_name_prefix="Strip")
+        self._executor = _executors[self.workers]
+
+    def apply(self, src, dst):
+        height = src.shape[0]
+        bands = min(self.workers, height // self.minRows)
+        if bands <= 1:
+            self.filter.apply(src, dst)
+            return
+        bounds = numpy.linspace(0, height, bands + 1).astype(int).tolist()
+        bounds = list(zip(bounds[:-1], bounds[1:]))
+        if not self.overlap:
+            self._run([(src[top:bottom], dst[top:bottom]) for top, bottom in bounds])
+            return
+        scratch = self._scratchFor(src, bounds)
+        self._run([(src[start : start + len(band)], band) for start, band in scratch])
+        # Only now, with every band read, may dst change under src.
+        for (top, bottom), (start, band) in zip(bounds, scratch):
+            dst[top:bottom] = band[top - start : bottom - start]
+
+    def _scratchFor(self, src, bounds):
+        key = (src.shape, src.dtype, len(bounds))
+        if key != self._key:
+            self._scratch = []
+            for top, bottom in bounds:
+                start, stop = max(0, top - self.overlap), min(src.shape[0], bottom + self.overlap)
+                band = numpy.empty((stop - start,) + src.shape[1:], src.dtype)
+                self._scratch.append((start, band))
+            self._key = key
+        return self._scratch
+
+    def _run(self, bands):
+        futures = [self._executor.submit(self.filter.apply, src, dst) for src, dst in bands]
+        for future in futures:
+            future.result()
@@ -0,0 +1,117 @@
+import logging
+import time
+
+# Each level is cheaper than the one before it: detect less often, then
+# on smaller images, then with a coarser pyramid, then without eyes.
+LEVELS = [
+    {"detectInterval": 1, "detectScale": 1.0, "scaleFactorStep": 0.0, "minNeighborsStep": 0, "searchEyes": True},
+    {"detectInterval": 2, "detectScale": 1.0, "scaleFactorStep": 0.0, "minNeighborsStep": 0, "searchEyes": True},
+    {"detectInterval": 3, "detectScale": 1.0, "scaleFactorStep": 0.0, "minNeighborsStep": 0, "searchEyes": True},
+    {"detectInterval": 3, "detectScale": 0.75, "scaleFactorStep": 0.0, "minNeighborsStep": 0, "searchEyes": True},
+    {"detectInterval": 3, "detectScale": 0.5, "scaleFactorStep": 0.0, "minNeighborsStep": 0, "searchEyes": True},
+    {"detectInterval": 3, "detectScale": 0.5, "scaleFactorStep": 0.1, "minNeighborsStep": 1, "searchEyes": True},
+    {"detectInterval": 3, "detectScale": 0.5, "scaleFactorStep": 0.2, "minNeighborsStep": 2, "searchEyes": True},
+    {"detectInterval": 3, "detectScale": 0.5, "scaleFactorStep": 0.2, "minNeighborsStep": 2, "searchEyes": False},
+]
+
+
+class PerformanceGovernor(object):
+    """
+    Keep the main loop near a target FPS by trading detection quality.
+
+    Call tick() once per frame. When the smoothed frame time stays over
+    the target, the governor steps one level down LEVELS; when it stays
+    well under, it steps back up. Settings are applied to the registered
+    trackers, and callers ask shouldDetect() whether to run them.
+    """
+
+    def __init__(
+        self,
+        targetFps,
+        trackers=(),
+        patience=15,
+        cooldown=30,
+        smoothing=0.1,
+        headroom=0.75,
+        logger="PerformanceGovernor",
+    ):
+        self._logger = logging.getLogger(logger)
+        self._logger.debug(f"Initial Class {logger}")
+        self.targetFrameTime = 1.0 / targetFps
+        self.patience = patience
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.headroom = headroom
+        self._trackers = []
+        self._level = 0
+        self._frameTime = None
+        self._lastTick = None
+        self._over = 0
+        self._under = 0
+        self._sinceChange = 0
+        for tracker in trackers:
+            self.addTracker(tracker)
+
+    @property
+    def level(self):
+        return self._level
+
+    @property
+    def settings(self):
+        return LEVELS[self._level]
+
+    @property
+    def frameTime(self):
+        return self._frameTime
+
+    def addTracker(self, tracker):
+        self._trackers.append((tracker, tracker.scaleFactor, tracker.minNeighbors))
+        self._apply(*self._trackers[-1])
+
+    def shouldDetect(self, sequence):
+        return sequence % self.settings["detectInterval"] == 0
+
+    def tick(self, now=None):
+        now = time.perf_counter() if now is None else now
+        if self._lastTick is not None:
+            self.observe(now - self._lastTick)
+        self._lastTick = now
+
+    def observe(self, frameTime):
+        if self._frameTime is None:
+            self._frameTime = frameTime
+        else:
+            self._frameTime += self.smoothing * (frameTime - self._frameTime)
+        self._sinceChange += 1
+        if self._frameTime > self.targetFrameTime:
+            self._over += 1
+            self._under = 0
+        elif self._frameTime < self.targetFrameTime * self.headroom:
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = self._under = 0
+        if self._sinceChange < self.cooldown:
+            return
+        if self._over >= self.patience and self._level < len(LEVELS) - 1:
+            self._setLevel(self._level + 1)
+        elif self._under >= self.patience * 2 and self._level > 0:
+            self._setLevel(self._level - 1)
+
+    def _setLevel(self, level):
+        self._logger.info(
+            f"Frame Time {self._frameTime * 1000:.1f}ms For Target "
+            f"{self.targetFrameTime * 1000:.1f}ms, Level {self._level} -> {level}: {LEVELS[level]}"
+        )
+        self._level = level
+        self._over = self._under = self._sinceChange = 0
+        for tracker in self._trackers:
+            self._apply(*tracker)
+
+    def _apply(self, tracker, scaleFactor, minNeighbors):
+        settings = self.settings
+        tracker.detectScale = settings["detectScale"]
+        tracker.scaleFactor = scaleFactor + settings["scaleFactorStep"]
+        tracker.minNeighbors = minNeighbors + settings["minNeighborsStep"]
+        if hasattr(tracker, "searchEyes"):
+            tracker.searchEyes = settings["searchEyes"]
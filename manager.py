@@ -1,8 +1,160 @@
+import collections
 import cv2
 from urllib.request import urlopen
 import numpy
 import time
 import logging
+import queue
+import threading
+
+import tracing
+import utils
+from metrics import PipelineMetrics
+from rawstore import RawFrameWriter
+
+
+class FrameSet(object):
+    """
+    The frames of one grab, retrieved lazily and at most once per channel.
+    """
+
+    def __init__(self, capture, channels=(0,), shouldConvertBit10To8=False, metrics=None, logger=None):
+        self._capture = capture
+        self.channels = tuple(channels)
+        self.shouldConvertBit10To8 = shouldConvertBit10To8
+        self._metrics = metrics
+        self._logger = logger if logger is not None else logging.getLogger("FrameSet")
+        self._frames = {}
+
+    def __getitem__(self, channel):
+        if channel not in self._frames:
+            self._frames[channel] = self._retrieve(channel)
+        return self._frames[channel]
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def __contains__(self, channel):
+        return channel in self._frames
+
+    def items(self):
+        return [(channel, self[channel]) for channel in self.channels]
+
+    def cached(self, channel):
+        """
+        Return the frame of a channel only if it was already retrieved.
+        """
+        return self._frames.get(channel)
+
+    def _retrieve(self, channel):
+        self._logger.debug(f"Retrieve Frame From Channel {channel}")
+        if self._metrics is not None:
+            with self._metrics.measure("retrieve"):
+                _, frame = self._capture.retrieve(None, channel)
+        else:
+            _, frame = self._capture.retrieve(None, channel)
+        if self.shouldConvertBit10To8 and frame is not None:
+            if frame.dtype == numpy.uint16:
+                self._logger.debug(f"Convert Frame Bit From 10 To 8")
+                frame = (frame >> 2).astype(numpy.uint8)
+            else:
+                self._logger.debug(f"Channel {channel} Already 8 Bit, Not Converted")
+        return frame
+
+
+class GrayCapture(object):
+    """
+    Wrap a capture so that retrieve() returns 1-channel luma frames.
+
+    Frames are converted once, at the source, and everything downstream
+    runs on gray frames. Sources that already deliver gray frames, such
+    as a GRAY8 GStreamer pipeline, pass through unchanged.
+    """
+
+    def __init__(self, capture):
+        self._capture = capture
+
+    def __getattr__(self, name):
+        return getattr(self._capture, name)
+
+    def retrieve(self, image=None, channel=0):
+        ret, frame = self._capture.retrieve(image, channel)
+        if ret and frame is not None and frame.size and not utils.isGray(frame):
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return ret, frame
+
+    def read(self, image=None):
+        if not self._capture.grab():
+            return False, None
+        return self.retrieve(image)
+
+
+def openCapture(cap, replay=False, rate="realtime", loop=False, gray=False):
+    """
+    Open a live capture, or a deterministic replay of a recorded source.
+
+    cap is a device index, a video file or stream URL, or
+    client:host[:port] for a CameoServer. With gray, the capture
+    delivers 1-channel luma frames.
+    """
+    if isinstance(cap, str) and cap.startswith("client:"):
+        from cvclient import CVClient
+
+        host, _, port = cap[len("client:"):].partition(":")
+        capture = CVClient(host, int(port) if port else 9999)
+    elif replay:
+        from replay import ReplayCapture
+
+        capture = ReplayCapture(cap, rate=rate, loop=loop)
+    else:
+        capture = cv2.VideoCapture(int(cap) if isinstance(cap, str) and cap.isdigit() else cap)
+    return GrayCapture(capture) if gray else capture
+
+
+class PrerollBuffer(object):
+    """
+    The latest seconds of frames, JPEG encoded in a ring bounded by age
+    and by memory, to be written ahead of a recording.
+    """
+
+    def __init__(self, seconds, maxBytes=64 << 20, quality=90):
+        self.seconds = seconds
+        self.maxBytes = maxBytes
+        self._params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self._frames = collections.deque()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def append(self, frame, timestamp=None):
+        timestamp = time.perf_counter() if timestamp is None else timestamp
+        ret, data = cv2.imencode(".jpg", frame, self._params)
+        if not ret:
+            return
+        self._frames.append((timestamp, data))
+        self._bytes += data.nbytes
+        while self._frames and (
+            timestamp - self._frames[0][0] > self.seconds or self._bytes > self.maxBytes
+        ):
+            self._bytes -= self._frames.popleft()[1].nbytes
+
+    def drain(self):
+        """
+        Decode and remove the buffered frames, oldest first.
+        """
+        while self._frames:
+            _, data = self._frames.popleft()
+            self._bytes -= data.nbytes
+            yield cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+
+    def clear(self):
+        self._frames.clear()
+        self._bytes = 0
 
 
 class CaptureManager(object):
@@ -12,6 +164,10 @@ class CaptureManager(object):
         previewWindowManager=None,
         shouldMirrorPreview=False,
         shouldConvertBit10To8=False,
+        metrics=None,
+        channels=None,
+        prerollSeconds=None,
+        prerollBytes=64 << 20,
         loggerName="CaptureManager",
     ):
         self._logger = logging.getLogger(loggerName)
@@ -21,7 +177,9 @@ class CaptureManager(object):
         self.shouldConvertBit10To8 = shouldConvertBit10To8
         self._capture = capture
         self._channel = 0
+        self.channels = channels
         self._enteredFrame = False
+        self._frameSet = None
         self._frame = None
         self._videoFilename = None
         self._imageFilename = None
@@ -30,6 +188,12 @@ class CaptureManager(object):
         self._fpsEstimate = None
         self._startTime = None
         self._videoWriter = None
+        self._rawWriter = None
+        self._lastExitTime = None
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+        self._preroll = PrerollBuffer(prerollSeconds, prerollBytes) if prerollSeconds else None
+        self._warmupFrames = None
+        self._grabTime = None
         if shouldMirrorPreview:
             self._logger.debug(f"Mirror Frame Enabled")
 
@@ -42,30 +206,41 @@ class CaptureManager(object):
 
     @property
     def fps(self):
+        """
+        Frame rate over the latest frames of the metrics window.
+        """
         return "{:.2f} FPS".format(self._fpsEstimate) if self._fpsEstimate is not None else "0.0 FPS"
 
+    @property
+    def frameSequence(self):
+        """
+        Sequence number of the current frame.
+        """
+        return self._frameElpased
+
     @property
     def channel(self):
         return self._channel
 
     @channel.setter
     def channel(self, value):
-        if self._channel != value:
-            self._channel = value
-            self._frame = None
+        """
+        Select the channel that is previewed and written on exit.
+        """
+        self._channel = value
+
+    @property
+    def frameSet(self):
+        """
+        The FrameSet of the current grab, or None outside a frame.
+        """
+        return self._frameSet if self._enteredFrame else None
 
     @property
     def frame(self):
-        if self._enteredFrame and self._frame is None:
-            self._logger.debug(f"Retrieve Frame From Channel {self._channel}")
-            _, self._frame = self._capture.retrieve(self._frame, self._channel)
-            if self.shouldConvertBit10To8 and self._frame is not None:
-                if self._frame.dtype == numpy.uint16:
-                    self._logger.debug(f"Convert Frame Bit From 10 To 8")
-                    self._frame = (self._frame >> 2).astype(numpy.uint8)
-                else:
-                    self._logger.warning(f"Can't Convert Bit, Frame Already 8 Bit.")
-        return self._frame
+        if self._enteredFrame and self._frameSet is not None:
+            return self._frameSet[self._channel]
+        return None
 
     @property
     def isWritingImage(self):
@@ -75,47 +250,90 @@ class CaptureManager(object):
     def isWritingVideo(self):
         return self._videoFilename is not None
 
+    @property
+    def isWritingRaw(self):
+        return self._rawWriter is not None
+
+    @property
+    def isOpened(self):
+        return self._capture is not None and self._capture.isOpened()
+
+    @property
+    def frameTimestamp(self):
+        """
+        time.perf_counter() when the current frame was grabbed.
+        """
+        return self._grabTime
+
     def enterFrame(self):
         """
         Capture the next frame, if any.
         """
         if self._capture is not None:
-            if not self._capture.isOpened():
-                self._logger.error("The Device Not Opened, Die...")
-                raise cv2.error(
-                    "The device not opened. Make sure the device is working"
-                )
-            self._logger.debug(f"Grabing Frame From")
-            self._enteredFrame = self._capture.grab()
+            tracing.setFrame(self._frameElpased)
+            with tracing.span("enterFrame"):
+                if not self._capture.isOpened():
+                    self._logger.error("The Device Not Opened, Die...")
+                    raise cv2.error(
+                        "The device not opened. Make sure the device is working"
+                    )
+                self._logger.debug(f"Grabing Frame From")
+                with self.metrics.measure("grab"):
+                    self._enteredFrame = self._capture.grab()
+                self._grabTime = time.perf_counter()
+                if self._enteredFrame:
+                    self._frameSet = FrameSet(
+                        self._capture,
+                        self.channels or (self._channel,),
+                        self.shouldConvertBit10To8,
+                        self.metrics,
+                        self._logger,
+                    )
 
     def exitFrame(self):
         """
         Draw to the window. Write to files. Release the frame.
         """
+        if self._frameSet is not None:
+            self._frame = self._frameSet.cached(self._channel)
         if self._frame is None:
+            self._frameSet = None
             self._enteredFrame = False
             return
+        now = time.perf_counter()
         if self._frameElpased == 0:
             self._startTime = time.time()
         else:
-            timeElpased = time.time()
-            self._fpsEstimate = self._frameElpased / (timeElpased - self._startTime)
+            self.metrics.record("frame", now - self._lastExitTime, now)
+            self._fpsEstimate = self.metrics.stage("frame").rate
+        self._lastExitTime = now
         self._frameElpased += 1
 
         if self.previewWindowManager is not None:
-            if self.shouldMirrorPreview:
-                mirroredFrame = numpy.fliplr(self._frame)
-                self.previewWindowManager.show(mirroredFrame)
-            else:
-                self.previewWindowManager.show(self._frame)
+            with self.metrics.measure("show"):
+                if self.shouldMirrorPreview:
+                    mirroredFrame = numpy.fliplr(self._frame)
+                    self.previewWindowManager.show(mirroredFrame)
+                else:
+                    self.previewWindowManager.show(self._frame)
 
-        if self.isWritingImage:
-            self._logger.info(f"Screenshot Is Being Saved Into {self._imageFilename}")
-            cv2.imwrite(self._imageFilename, self._frame)
-            self._imageFilename = None
+        if self.isWritingImage or self.isWritingVideo or self.isWritingRaw:
+            # Only frames that are written count towards the write stage.
+            with self.metrics.measure("write"):
+                if self.isWritingImage:
+                    self._logger.info(f"Screenshot Is Being Saved Into {self._imageFilename}")
+                    cv2.imwrite(self._imageFilename, self._frame)
+                    self._imageFilename = None
 
-        self._writeVideoFrame()
+                self._writeVideoFrame()
+                if self.isWritingRaw and not self._rawWriter.append(self._frame):
+                    self.stopWriteRaw()
+        if not self.isWritingVideo and self._preroll is not None:
+            with self.metrics.measure("preroll"):
+                self._preroll.append(self._frame)
+        self.metrics.maybeExport()
         self._frame = None
+        self._frameSet = None
         self._enteredFrame = False
 
     def writeImage(self, filename):
@@ -127,7 +345,8 @@ class CaptureManager(object):
 
     def startWriteVideo(self, filename, encoding=cv2.VideoWriter_fourcc(*"MJPG")):
         """
-        Start writing exited frames to a video file.
+        Start writing exited frames to a video file, after the pre-roll
+        frames when a pre-roll buffer is kept.
         """
         self._logger.info(f"Start Video Recording Into {filename}")
         self._videoFilename = filename
@@ -141,6 +360,30 @@ class CaptureManager(object):
         self._videoEncoding = None
         self._videoFilename = None
         self._videoWriter = None
+        self._warmupFrames = None
+
+    def startWriteRaw(self, dirname, capacity=1 << 30, maxFrames=100000):
+        """
+        Start writing exited frames losslessly into a raw frame store.
+
+        Returns False when the store can't be allocated.
+        """
+        self._logger.info(f"Start Raw Recording Into {dirname}")
+        try:
+            self._rawWriter = RawFrameWriter(dirname, capacity, maxFrames)
+        except OSError as e:
+            self._logger.error(f"Can't Start Raw Recording Into {dirname}: {e}")
+            return False
+        return True
+
+    def stopWriteRaw(self):
+        """
+        Stop writing exited frames to the raw frame store.
+        """
+        self._logger.info(f"Stop Writing Raw Frames")
+        if self._rawWriter is not None:
+            self._rawWriter.close()
+        self._rawWriter = None
 
     def _writeVideoFrame(self):
         if not self.isWritingVideo:
@@ -151,6 +394,10 @@ class CaptureManager(object):
             self._logger.debug(f"Get FPS from Camera {fps}")
             if fps is None or (fps is not None and fps <= 0.0):
                 if self._frameElpased < 20:
+                    # Hold frames until the FPS estimate settles, they are written first.
+                    if self._warmupFrames is None:
+                        self._warmupFrames = PrerollBuffer(float("inf"), float("inf"))
+                    self._warmupFrames.append(self._frame)
                     return
                 else:
                     fps = int(self._fpsEstimate)
@@ -163,22 +410,42 @@ class CaptureManager(object):
             except TypeError:
                 size = self._frame.shape[:2][::-1]
             self._videoWriter = cv2.VideoWriter(
-                self._videoFilename, self._videoEncoding, fps, size
+                self._videoFilename, self._videoEncoding, fps, size, not utils.isGray(self._frame)
             )
+            for buffer in (self._preroll, self._warmupFrames):
+                if buffer is not None:
+                    self._logger.info(f"Write {len(buffer)} Buffered Frames")
+                    for frame in buffer.drain():
+                        self._videoWriter.write(frame)
+            self._warmupFrames = None
         self._logger.debug(f"Write Frame {self._frameElpased}")
-        self._videoWriter.write(self._frame)
+        with tracing.span("videoWrite"):
+            self._videoWriter.write(self._frame)
 
     def close(self):
+        if self.isWritingRaw:
+            self.stopWriteRaw()
         self._capture.release()
 
 
 
 class WindowManager(object):
+    """
+    A HighGUI window and its keypress events.
+
+    With maxDisplayFps set, the window lives on its own render thread that
+    redraws the latest shown frame at most maxDisplayFps times a second,
+    so show() never blocks the pipeline. Shown frames must not be changed
+    afterwards. Keypresses are queued by the render thread and delivered
+    to keypressCallback by processEvent() on the calling thread.
+    """
+
     def __init__(
         self,
         windowName,
         keypressCallback=None,
         windowSize=None,
+        maxDisplayFps=None,
         loggerName="WindowManager",
     ):
         self._logger = logging.getLogger(loggerName)
@@ -187,31 +454,80 @@ class WindowManager(object):
         self._windowName = windowName
         self._isWindowCreated = False
         self._windowSize = windowSize
+        self.maxDisplayFps = maxDisplayFps
+        self._latestFrame = None
+        self._keycodes = queue.Queue()
+        self._renderThread = None
+        self._stopRender = threading.Event()
 
     @property
     def isWindowCreated(self):
         return self._isWindowCreated
 
-    def createWindow(self):
-        self._logger.info(f"Create Window as {self._windowName}")
+    def _namedWindow(self):
         cv2.namedWindow(self._windowName)
         if self._windowSize is not None:
             self._logger.debug(f"Resize window to {self._windowSize}")
             cv2.resizeWindow(self._windowName, *self._windowSize)
+
+    def createWindow(self):
+        self._logger.info(f"Create Window as {self._windowName}")
+        if self.maxDisplayFps:
+            self._stopRender.clear()
+            self._renderThread = threading.Thread(target=self._render, name="Render", daemon=True)
+            self._renderThread.start()
+        else:
+            self._namedWindow()
         self._isWindowCreated = True
 
     def show(self, frame):
         self._logger.debug(f"Show Frame")
-        cv2.imshow(self._windowName, frame)
+        if self._renderThread is not None:
+            self._latestFrame = frame
+        else:
+            cv2.imshow(self._windowName, frame)
 
     def destroyWindow(self):
         self._logger.info(f"Destroy Window {self._windowName}")
-        cv2.destroyWindow(self._windowName)
+        if self._renderThread is not None:
+            self._stopRender.set()
+            if self._renderThread is not threading.current_thread():
+                self._renderThread.join()
+            self._renderThread = None
+        else:
+            cv2.destroyWindow(self._windowName)
         self._isWindowCreated = False
 
     def processEvent(self):
-        keycode = cv2.waitKey(1)
-        if self.keypressCallback is not None and keycode != -1:
-            self._logger.debug(f"Process Pressed Key {keycode}")
-            self.keypressCallback(keycode)
+        if self.maxDisplayFps:
+            keycodes = []
+            while not self._keycodes.empty():
+                keycodes.append(self._keycodes.get_nowait())
+        else:
+            with tracing.span("waitKey"):
+                keycodes = [cv2.waitKey(1)]
+        for keycode in keycodes:
+            if self.keypressCallback is not None and keycode != -1:
+                self._logger.debug(f"Process Pressed Key {keycode}")
+                self.keypressCallback(keycode)
 
+    def _render(self):
+        """
+        Redraw the latest frame and poll keys at the capped display rate.
+        """
+        self._namedWindow()
+        interval = 1.0 / self.maxDisplayFps
+        shownFrame = None
+        while not self._stopRender.is_set():
+            start = time.perf_counter()
+            frame = self._latestFrame
+            if frame is not None and frame is not shownFrame:
+                with tracing.span("imshow"):
+                    cv2.imshow(self._windowName, frame)
+                shownFrame = frame
+            remaining = interval - (time.perf_counter() - start)
+            with tracing.span("waitKey"):
+                keycode = cv2.waitKey(max(1, int(remaining * 1000)))
+            if keycode != -1:
+                self._keycodes.put(keycode)
+        cv2.destroyWindow(self._windowName)
@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy
+
+import tracing
+
+
+class RollingStats(object):
+    """
+    Keep the latest samples of one pipeline stage in a fixed-size ring.
+    """
+
+    def __init__(self, size=256):
+        self._size = size
+        self._durations = numpy.zeros(size, dtype=numpy.float64)
+        self._stamps = numpy.zeros(size, dtype=numpy.float64)
+        self._index = 0
+        self._filled = 0
+        self._total = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return self._total
+
+    def add(self, duration, stamp=None):
+        if stamp is None:
+            stamp = time.perf_counter()
+        with self._lock:
+            self._durations[self._index] = duration
+            self._stamps[self._index] = stamp
+            self._index = (self._index + 1) % self._size
+            self._filled = min(self._filled + 1, self._size)
+            self._total += 1
+            self._sum += duration
+
+    def _window(self):
+        with self._lock:
+            if self._filled < self._size:
+                return (
+                    self._durations[: self._filled].copy(),
+                    self._stamps[: self._filled].copy(),
+                )
+            return (
+                numpy.roll(self._durations, -self._index),
+                numpy.roll(self._stamps, -self._index),
+            )
+
+    @property
+    def rate(self):
+        """
+        Events per second over the samples currently in the ring.
+        """
+        _, stamps = self._window()
+        if len(stamps) < 2:
+            return 0.0
+        span = stamps[-1] - stamps[0]
+        return (len(stamps) - 1) / span if span > 0 else 0.0
+
+    def percentiles(self, qs=(50, 95, 99)):
+        durations, _ = self._window()
+        if len(durations) == 0:
+            return [0.0] * len(qs)
+        return list(numpy.percentile(durations, qs))
+
+    def summary(self):
+        durations, stamps = self._window()
+        if len(durations) == 0:
+            return {"count": self._total, "sum": self._sum, "rate": 0.0, "mean": 0.0,
+                    "p50": 0.0, "p95": 0.0, "p99": 0.0}
+        p50, p95, p99 = numpy.percentile(durations, (50, 95, 99))
+        span = stamps[-1] - stamps[0]
+        return {
+            "count": self._total,
+            "sum": self._sum,
+            "rate": (len(stamps) - 1) / span if span > 0 else 0.0,
+            "mean": float(durations.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+        }
+
+
+class PipelineMetrics(object):
+    """
+    Per-stage latency timers with periodic JSON lines or Prometheus export.
+    """
+
+    def __init__(
+        self,
+        windowSize=256,
+        exportPath=None,
+        exportFormat="json",
+        exportInterval=10.0,
+        loggerName="PipelineMetrics",
+    ):
+        self._logger = logging.getLogger(loggerName)
+        self._logger.debug(f"Initial Class {loggerName}")
+        if exportFormat not in ("json", "prometheus"):
+            raise ValueError(f"Unknown metrics export format {exportFormat}")
+        self._windowSize = windowSize
+        self._stages = {}
+        self._lock = threading.Lock()
+        self.exportPath = exportPath
+        self.exportFormat = exportFormat
+        self.exportInterval = exportInterval
+        self._lastExport = time.perf_counter()
+
+    def stage(self, name):
+        stats = self._stages.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._stages.setdefault(name, RollingStats(self._windowSize))
+        return stats
+
+    def record(self, name, duration, stamp=None):
+        self.stage(name).add(duration, stamp)
+
+    @contextmanager
+    def measure(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.record(name, end - start, end)
+            tracing.complete(name, start, end)
+
+    def snapshot(self):
+        return {name: stats.summary() for name, stats in list(self._stages.items())}
+
+    def toJSON(self):
+        return json.dumps({"time": time.time(), "stages": self.snapshot()})
+
+    def toPrometheus(self):
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP cameo_stage_latency_seconds Per-stage latency over the rolling window.",
+            "# TYPE cameo_stage_latency_seconds summary",
+        ]
+        for name, stats in snapshot.items():
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(
+                    f'cameo_stage_latency_seconds{{stage="{name}",quantile="{quantile}"}} {stats[key]:.6f}'
+                )
+            lines.append(f'cameo_stage_latency_seconds_sum{{stage="{name}"}} {stats["sum"]:.6f}')
+            lines.append(f'cameo_stage_latency_seconds_count{{stage="{name}"}} {stats["count"]}')
+        lines.append("# HELP cameo_stage_rate_hz Per-stage rate over the rolling window.")
+        lines.append("# TYPE cameo_stage_rate_hz gauge")
+        for name, stats in snapshot.items():
+            lines.append(f'cameo_stage_rate_hz{{stage="{name}"}} {stats["rate"]:.3f}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path=None, exportFormat=None):
+        """
+        Append a JSON line or atomically rewrite a Prometheus text file.
+        """
+        path = path or self.exportPath
+        exportFormat = exportFormat or self.exportFormat
+        if path is None:
+            return
+        self._logger.debug(f"Export Metrics Into {path}")
+        if exportFormat == "prometheus":
+            tmpPath = f"{path}.tmp"
+            with open(tmpPath, "w") as file:
+                file.write(self.toPrometheus())
+            os.replace(tmpPath, path)
+        else:
+            with open(path, "a") as file:
+                file.write(self.toJSON() + "\n")
+
+    def maybeExport(self):
+        if self.exportPath is None:
+            return
+        now = time.perf_counter()
+        if now - self._lastExport >= self.exportInterval:
+            self._lastExport = now
+            try:
+                self.export()
+            except OSError as e:
+                self._logger.error(f"Can't Export Metrics: {e}")
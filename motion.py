@@ -0,0 +1,120 @@
+import logging
+
+import cv2
+import numpy
+
+import utils
+
+
+def _union(a, b):
+    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+    x1, y1 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+class MotionDetector(object):
+    """
+    Find moving regions by diffing small gray frames with a running background.
+
+    update() returns the region trackers should search, padded around
+    every moving blob, or None when nothing moved and the previous
+    detections still hold. Every refreshInterval frames the whole frame
+    is returned, so detections can't go stale forever.
+    """
+
+    def __init__(
+        self,
+        width=160,
+        threshold=25,
+        minArea=0.002,
+        learningRate=0.05,
+        padding=0.25,
+        refreshInterval=300,
+        logger="MotionDetector",
+    ):
+        self._logger = logging.getLogger(logger)
+        self._logger.debug(f"Initial Class {logger}")
+        self.width = width
+        self.threshold = threshold
+        self.minArea = minArea
+        self.learningRate = learningRate
+        self.padding = padding
+        self.refreshInterval = refreshInterval
+        self._background = None
+        self._kernel = numpy.ones((3, 3), numpy.uint8)
+        self._sinceDetect = 0
+        self._pending = None
+        self.rects = []
+
+    def reset(self):
+        self._background = None
+        self._pending = None
+
+    def _small(self, frame):
+        if not utils.isGray(frame):
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        h, w = frame.shape[:2]
+        if w > self.width:
+            frame = cv2.resize(frame, (self.width, h * self.width // w), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(frame, (5, 5), 0)
+
+    def detect(self, frame):
+        """
+        Return the (x, y, w, h) rects of moving blobs in frame coordinates.
+        """
+        small = self._small(frame)
+        if self._background is None or self._background.shape != small.shape:
+            self._background = small.astype(numpy.float32)
+            # Without a background everything counts as motion.
+            self.rects = [(0, 0, frame.shape[1], frame.shape[0])]
+            return self.rects
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self._background))
+        cv2.accumulateWeighted(small, self._background, self.learningRate)
+        _, mask = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        mask = cv2.dilate(mask, self._kernel, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        scale = frame.shape[1] / small.shape[1]
+        minArea = self.minArea * small.shape[0] * small.shape[1]
+        self.rects = [
+            tuple(int(round(value * scale)) for value in cv2.boundingRect(contour))
+            for contour in contours
+            if cv2.contourArea(contour) >= minArea
+        ]
+        return self.rects
+
+    def update(self, frame, detect=True):
+        """
+        Return the padded (x, y, w, h) region to detect in, or None.
+
+        Call it on every frame. On frames where detection is skipped pass
+        detect=False: the region is then held back and merged into the
+        region of the next detecting call, so no motion is lost.
+        """
+        region = self._region(frame)
+        if self._pending is not None:
+            region = self._pending if region is None else _union(self._pending, region)
+        if not detect:
+            self._pending = region
+            return None
+        self._pending = None
+        return region
+
+    def _region(self, frame):
+        rects = self.detect(frame)
+        self._sinceDetect += 1
+        h, w = frame.shape[:2]
+        if self._sinceDetect >= self.refreshInterval:
+            self._sinceDetect = 0
+            return (0, 0, w, h)
+        if not rects:
+            return None
+        self._sinceDetect = 0
+        rects = numpy.array(rects)
+        x0, y0 = rects[:, :2].min(axis=0)
+        x1, y1 = (rects[:, :2] + rects[:, 2:]).max(axis=0)
+        # Faces only partly inside a blob must still fit in the region.
+        padX = int((x1 - x0) * self.padding) + w // 16
+        padY = int((y1 - y0) * self.padding) + h // 16
+        x0, y0 = max(0, x0 - padX), max(0, y0 - padY)
+        x1, y1 = min(w, x1 + padX), min(h, y1 + padY)
+        return (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
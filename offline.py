@@ -0,0 +1,167 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy
+
+import filters
+from detections import DETECTION_DTYPE
+from replay import VideoFileSource
+
+FILTERS = {
+    "blur": filters.BlurFilter,
+    "sharpen": filters.SharpenFilter,
+    "emboss": filters.EmpossFilter,
+    "edges": filters.FindEdgesFilter,
+}
+
+
+def splitRanges(length, segments):
+    """
+    Split frames [0, length) into at most segments contiguous ranges.
+
+    The last range is open ended, a frame count reported by the container
+    is only an estimate.
+    """
+    segments = max(1, min(segments, length))
+    bounds = numpy.linspace(0, length, segments + 1).astype(int).tolist()
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+
+def _createTracker(detect, trashold):
+    from tracker import FaceTracker, ObjectTracker
+
+    if detect:
+        return ObjectTracker(detect, scaleFactor=trashold)
+    return FaceTracker(scaleFactor=trashold, minNeighbors=10)
+
+
+def processSegment(path, start, stop, segmentPath, detect=None, trashold=1.3, filterName=None, motion=False, fourcc="mp4v"):
+    """
+    Run the tracker and filter pipeline over frames [start, stop) of path.
+
+    Runs in a worker process with its own decoder. Writes the annotated
+    frames into segmentPath and returns the detections of the range.
+    """
+    source = VideoFileSource(path)
+    tracker = _createTracker(detect, trashold)
+    curveFilter = FILTERS[filterName]() if filterName else None
+    motionDetector = None
+    if motion:
+        from motion import MotionDetector
+
+        motionDetector = MotionDetector()
+    writer = cv2.VideoWriter(segmentPath, cv2.VideoWriter_fourcc(*fourcc), source.fps or 30.0, source.size)
+    detections = []
+    index = start
+    try:
+        while stop is None or index < stop:
+            frame = source.read(index)
+            if frame is None:
+                break
+            region = None
+            shouldDetect = True
+            if motionDetector is not None:
+                region = motionDetector.update(frame)
+                shouldDetect = region is not None
+            if shouldDetect:
+                tracker.update(frame, index, region)
+                results = tracker.faces if hasattr(tracker, "faces") else tracker.objects
+                detections.append(results[results["frame"] == index])
+            tracker.drawDebugRects(frame)
+            if curveFilter is not None:
+                curveFilter.apply(frame, frame)
+            writer.write(frame)
+            index += 1
+    finally:
+        writer.release()
+        source.release()
+    if detections:
+        return index - start, numpy.concatenate(detections)
+    return index - start, numpy.zeros(0, DETECTION_DTYPE)
+
+
+def concatSegments(segmentPaths, output, fps, size, fourcc="mp4v"):
+    """
+    Join segment files into output, without re-encoding when ffmpeg exists.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        listPath = f"{output}.segments.txt"
+        with open(listPath, "w") as file:
+            for path in segmentPaths:
+                file.write(f"file '{os.path.abspath(path)}'\n")
+        try:
+            subprocess.run(
+                [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", listPath, "-c", "copy", output],
+                check=True,
+            )
+            return
+        except subprocess.CalledProcessError:
+            logging.getLogger("Offline").warning("ffmpeg Concat Failed, Re-Encode Segments")
+        finally:
+            os.remove(listPath)
+    writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    try:
+        for path in segmentPaths:
+            capture = cv2.VideoCapture(path)
+            ret, frame = capture.read()
+            while ret:
+                writer.write(frame)
+                ret, frame = capture.read()
+            capture.release()
+    finally:
+        writer.release()
+
+
+def processVideo(
+    path,
+    output,
+    jobs=None,
+    segments=None,
+    detect=None,
+    trashold=1.3,
+    filterName=None,
+    motion=False,
+    fourcc="mp4v",
+    logger="Offline",
+):
+    """
+    Process a video file in parallel segments, one decoder per process.
+
+    Writes the annotated video to output and the detections of every
+    frame, in frame order, to output's name with a .detections.npy
+    suffix. Returns the detections.
+    """
+    logger = logging.getLogger(logger)
+    jobs = jobs or os.cpu_count() or 1
+    source = VideoFileSource(path)
+    length, fps, size = len(source), source.fps or 30.0, source.size
+    source.release()
+    # A few more segments than workers evens out segments that detect more.
+    ranges = splitRanges(max(length, 1), segments or jobs * 2)
+    logger.info(f"Process {length} Frames Of {path} In {len(ranges)} Segments On {jobs} Workers")
+    started = time.perf_counter()
+    extension = os.path.splitext(output)[1] or ".mp4"
+    with tempfile.TemporaryDirectory(prefix="cameo-offline-", dir=os.path.dirname(os.path.abspath(output))) as tmpdir:
+        segmentPaths = [os.path.join(tmpdir, f"segment-{index:05d}{extension}") for index in range(len(ranges))]
+        with ProcessPoolExecutor(jobs) as executor:
+            futures = [
+                executor.submit(processSegment, path, start, stop, segmentPath, detect, trashold, filterName, motion, fourcc)
+                for (start, stop), segmentPath in zip(ranges, segmentPaths)
+            ]
+            results = [future.result() for future in futures]
+        concatSegments(segmentPaths, output, fps, size, fourcc)
+    frames = sum(count for count, _ in results)
+    detections = numpy.concatenate([segmentDetections for _, segmentDetections in results])
+    numpy.save(f"{os.path.splitext(output)[0]}.detections.npy", detections)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Processed {frames} Frames In {elapsed:.1f}s ({frames / max(elapsed, 1e-9):.1f} FPS), {len(detections)} Detections")
+    return detections
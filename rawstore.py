@@ -0,0 +1,165 @@
+import logging
+import os
+import time
+
+import numpy
+from numpy.lib.format import open_memmap
+
+DATA_FILENAME = "frames.raw"
+INDEX_FILENAME = "index.npy"
+
+INDEX_DTYPE = numpy.dtype(
+    [
+        ("timestamp", "<f8"),
+        ("offset", "<u8"),
+        ("height", "<u4"),
+        ("width", "<u4"),
+        ("channels", "<u2"),
+        ("dtype", "S4"),
+    ]
+)
+
+
+def isRawStore(path):
+    return os.path.isfile(os.path.join(path, INDEX_FILENAME))
+
+
+class RawFrameWriter(object):
+    """
+    Append raw frames to a preallocated memory-mapped file.
+
+    A store is a directory holding frames.raw, the concatenated frame
+    bytes, and index.npy, one row of timestamp, offset and shape per
+    frame. Appending a frame costs one copy into the mapping. The data
+    file is allocated on disk up front, opening a store raises OSError
+    when there is no room for capacity bytes.
+    """
+
+    def __init__(self, dirname, capacity=1 << 30, maxFrames=100000, logger="RawFrameWriter"):
+        self._logger = logging.getLogger(logger)
+        self._logger.debug(f"Initial Class {logger}")
+        # Set first, so that close() works on a half-initialized writer.
+        self._data = None
+        self._index = None
+        os.makedirs(dirname, exist_ok=True)
+        self.dirname = dirname
+        path = os.path.join(dirname, DATA_FILENAME)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC)
+        try:
+            # Reserve the blocks up front, a store on a full disk would
+            # otherwise die of SIGBUS writing into a sparse mapping.
+            os.posix_fallocate(fd, 0, capacity)
+        except OSError:
+            os.remove(path)
+            raise
+        finally:
+            os.close(fd)
+        self._data = numpy.memmap(path, numpy.uint8, "r+", shape=(capacity,))
+        self._index = open_memmap(
+            os.path.join(dirname, INDEX_FILENAME), "w+", INDEX_DTYPE, (maxFrames,)
+        )
+        self._count = 0
+        self._offset = 0
+        self._isFull = False
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def isFull(self):
+        return self._isFull
+
+    def append(self, frame, timestamp=None):
+        """
+        Copy a frame into the store, return False once it is full.
+        """
+        if self._data is None or self._isFull:
+            return False
+        frame = numpy.ascontiguousarray(frame)
+        size = frame.nbytes
+        if self._count >= len(self._index) or self._offset + size > len(self._data):
+            self._logger.warning(f"Raw Store {self.dirname} Is Full After {self._count} Frames")
+            self._isFull = True
+            return False
+        self._data[self._offset : self._offset + size] = frame.reshape(-1).view(numpy.uint8)
+        row = self._index[self._count]
+        row["timestamp"] = time.time() if timestamp is None else timestamp
+        row["offset"] = self._offset
+        row["height"] = frame.shape[0]
+        row["width"] = frame.shape[1]
+        row["channels"] = frame.shape[2] if frame.ndim > 2 else 1
+        row["dtype"] = frame.dtype.str
+        self._offset += size
+        self._count += 1
+        return True
+
+    def close(self):
+        """
+        Flush the store and trim the preallocated files to their used size.
+        """
+        if self._data is None:
+            return
+        self._logger.info(f"Close Raw Store {self.dirname} With {self._count} Frames")
+        self._data.flush()
+        index = numpy.array(self._index[: self._count])
+        self._data = None
+        self._index = None
+        os.truncate(os.path.join(self.dirname, DATA_FILENAME), self._offset)
+        numpy.save(os.path.join(self.dirname, INDEX_FILENAME), index)
+
+    def __del__(self):
+        self.close()
+
+
+class RawFrameReader(object):
+    """
+    Random access to a raw frame store through numpy.memmap views.
+
+    Frames returned by indexing are zero-copy views of the mapping, so
+    they are read-only unless mode is "c" (copy-on-write).
+    """
+
+    def __init__(self, dirname, mode="r"):
+        self.dirname = dirname
+        index = numpy.load(os.path.join(dirname, INDEX_FILENAME), mmap_mode="r")
+        # A store that was not closed keeps its preallocated, zeroed rows.
+        used = index["height"] > 0
+        self.index = index if used.all() else numpy.array(index[used])
+        if len(self.index):
+            self._data = numpy.memmap(os.path.join(dirname, DATA_FILENAME), numpy.uint8, mode)
+        else:
+            self._data = numpy.empty(0, dtype=numpy.uint8)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def timestamps(self):
+        return self.index["timestamp"]
+
+    def timestamp(self, index):
+        return float(self.index[index]["timestamp"])
+
+    def shape(self, index):
+        row = self.index[index]
+        if row["channels"] == 1:
+            return (int(row["height"]), int(row["width"]))
+        return (int(row["height"]), int(row["width"]), int(row["channels"]))
+
+    def __getitem__(self, index):
+        row = self.index[index]
+        dtype = numpy.dtype(row["dtype"].decode())
+        shape = self.shape(index)
+        offset = int(row["offset"])
+        size = int(numpy.prod(shape)) * dtype.itemsize
+        return self._data[offset : offset + size].view(dtype).reshape(shape)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def seekTime(self, timestamp):
+        """
+        Return the index of the first frame at or after timestamp.
+        """
+        return int(numpy.searchsorted(self.timestamps, timestamp))
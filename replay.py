@@ -0,0 +1,238 @@
+import logging
+import os
+import time
+
+import cv2
+import numpy
+
+from rawstore import RawFrameReader, isRawStore
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".pgm", ".ppm")
+
+
+class VideoFileSource(object):
+    """
+    Frames of a video file, decoded in order and seeked on demand.
+    """
+
+    def __init__(self, filename):
+        self._capture = cv2.VideoCapture(filename)
+        if not self._capture.isOpened():
+            raise cv2.error(f"Can't open video file {filename}")
+        self._position = 0
+        self.fps = self._capture.get(cv2.CAP_PROP_FPS) or None
+        self.size = (
+            int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+        self._length = int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def __len__(self):
+        return self._length
+
+    def timestamp(self, index):
+        return None
+
+    def read(self, index):
+        skip = index - self._position
+        if 0 < skip <= 8:
+            # Decoding a few frames is cheaper than a keyframe seek.
+            for _ in range(skip):
+                self._capture.grab()
+        elif skip != 0:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, frame = self._capture.read()
+        self._position = index + 1
+        return frame if ret else None
+
+    def release(self):
+        self._capture.release()
+
+
+class ImageDirectorySource(object):
+    """
+    Image files of a directory, played in file name order.
+    """
+
+    def __init__(self, dirname, fps=30.0):
+        self._filenames = sorted(
+            os.path.join(dirname, name)
+            for name in os.listdir(dirname)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self._filenames:
+            raise cv2.error(f"No images found in {dirname}")
+        self.fps = fps
+        first = cv2.imread(self._filenames[0], cv2.IMREAD_UNCHANGED)
+        self.size = (first.shape[1], first.shape[0])
+
+    def __len__(self):
+        return len(self._filenames)
+
+    def timestamp(self, index):
+        return None
+
+    def read(self, index):
+        return cv2.imread(self._filenames[index], cv2.IMREAD_UNCHANGED)
+
+    def release(self):
+        pass
+
+
+class RawStoreSource(object):
+    """
+    Frames of a raw frame store, replayed on their recorded timestamps.
+    """
+
+    def __init__(self, dirname):
+        self._reader = RawFrameReader(dirname)
+        if len(self._reader) == 0:
+            raise cv2.error(f"Raw store {dirname} is empty")
+        interval = numpy.median(numpy.diff(self._reader.timestamps)) if len(self._reader) > 1 else 0
+        self.fps = 1.0 / interval if interval > 0 else None
+        height, width = self._reader.shape(0)[:2]
+        self.size = (width, height)
+
+    def __len__(self):
+        return len(self._reader)
+
+    def timestamp(self, index):
+        return self._reader.timestamp(index)
+
+    def read(self, index):
+        # The pipeline draws on its frames, so hand out a private copy.
+        return self._reader[index].copy()
+
+    def release(self):
+        pass
+
+
+def openSource(path, fps=None):
+    if isRawStore(path):
+        return RawStoreSource(path)
+    if os.path.isdir(path):
+        return ImageDirectorySource(path, fps or 30.0)
+    return VideoFileSource(path)
+
+
+class ReplayCapture(object):
+    """
+    A deterministic stand-in for cv2.VideoCapture that replays video
+    files, image directories or raw frame stores at real-time, fixed or
+    unlimited rate.
+
+    rate is "realtime" to follow the source timing, a number of frames
+    per second, or None/"unlimited" to deliver frames as fast as asked.
+    """
+
+    def __init__(self, source, rate="realtime", loop=False, logger="ReplayCapture"):
+        self._logger = logging.getLogger(logger)
+        self._logger.debug(f"Initial Class {logger}")
+        self._source = openSource(source) if isinstance(source, str) else source
+        if rate in (None, "unlimited", 0):
+            self._rate = None
+        elif rate == "realtime":
+            self._rate = "realtime"
+        else:
+            self._rate = float(rate)
+        self.loop = loop
+        self._index = -1
+        self._grabed = False
+        self._isOpened = True
+        self._anchor = None
+
+    @property
+    def position(self):
+        return self._index
+
+    def isOpened(self):
+        return self._isOpened
+
+    def seek(self, index):
+        """
+        Make the next grab return frame `index`.
+        """
+        self._index = max(0, min(int(index), len(self._source))) - 1
+        self._anchor = None
+        self._grabed = False
+
+    def _frameOffset(self, index):
+        if self._rate == "realtime":
+            timestamp = self._source.timestamp(index)
+            if timestamp is not None:
+                return timestamp
+            fps = self._source.fps
+        else:
+            fps = self._rate
+        return index / fps if fps else None
+
+    def _pace(self, index):
+        if self._rate is None:
+            return
+        offset = self._frameOffset(index)
+        if offset is None:
+            return
+        now = time.perf_counter()
+        if self._anchor is None:
+            self._anchor = now - offset
+            return
+        delay = self._anchor + offset - now
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1.0:
+            # Too far behind to catch up, restart the clock here.
+            self._anchor = now - offset
+
+    def grab(self):
+        if not self._isOpened:
+            return False
+        index = self._index + 1
+        if index >= len(self._source):
+            if not self.loop or len(self._source) == 0:
+                self._logger.debug("End Of Replay")
+                self._grabed = False
+                return False
+            self._logger.debug("Loop Replay From Start")
+            index = 0
+            self._anchor = None
+        self._pace(index)
+        self._index = index
+        self._grabed = True
+        return True
+
+    def retrieve(self, image=None, channel=0):
+        if not self._grabed:
+            return False, None
+        frame = self._source.read(self._index)
+        return frame is not None, frame
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, propId):
+        if propId == cv2.CAP_PROP_FPS:
+            if isinstance(self._rate, float):
+                return self._rate
+            return float(self._source.fps or 0.0)
+        elif propId == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self._source.size[0])
+        elif propId == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self._source.size[1])
+        elif propId == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self._source))
+        elif propId == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._index + 1)
+        return 0.0
+
+    def set(self, propId, value):
+        if propId == cv2.CAP_PROP_POS_FRAMES:
+            self.seek(value)
+            return True
+        return False
+
+    def release(self):
+        if self._isOpened:
+            self._source.release()
+            self._isOpened = False
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import queue
+import tarfile
+import threading
+
+import cv2
+
+STATE_FILENAME = "state.json"
+MANIFEST_FILENAME = "manifest.txt"
+NEGATIVE_FILENAME = "neg.txt"
+
+
+class SampleStore(object):
+    """
+    Labeled training samples written by a background thread.
+
+    state.json keeps the next sample counters and how much of the manifest
+    is already archived, and manifest.txt keeps one line per sample, so
+    neither startup nor archiving has to scan the sample directories.
+    """
+
+    def __init__(self, dirname="takedImages", size=(640, 480), logger="SampleStore"):
+        self._logger = logging.getLogger(logger)
+        self._logger.debug(f"Initial Class {logger}")
+        self.dirname = dirname
+        self.size = size
+        for kind in ("negative", "positive"):
+            os.makedirs(os.path.join(dirname, kind), exist_ok=True)
+        self._statePath = os.path.join(dirname, STATE_FILENAME)
+        self._manifestPath = os.path.join(dirname, MANIFEST_FILENAME)
+        if os.path.exists(self._statePath):
+            with open(self._statePath) as file:
+                self._state = json.load(file)
+        else:
+            self._state = self._rebuildState()
+        self.positiveCount = self._state["positive"]
+        self.negativeCount = self._state["negative"]
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def _rebuildState(self):
+        """
+        Scan a sample tree written without a manifest, once.
+        """
+        self._logger.info(f"Build Manifest For {self.dirname}")
+        state = {"positive": 0, "negative": 0, "archivedOffset": 0}
+        with open(self._manifestPath, "w") as manifest:
+            for kind in ("negative", "positive"):
+                indices = sorted(
+                    int(name.split(".")[0])
+                    for name in os.listdir(os.path.join(self.dirname, kind))
+                    if name.endswith(".jpg")
+                )
+                for index in indices:
+                    manifest.write(f"{kind} {kind}/{index}.jpg\n")
+                state[kind] = indices[-1] + 1 if indices else 0
+        self._saveState(state)
+        return state
+
+    def _saveState(self, state):
+        tmpPath = f"{self._statePath}.tmp"
+        with open(tmpPath, "w") as file:
+            json.dump(state, file)
+        os.replace(tmpPath, self._statePath)
+
+    def addNegative(self, frame):
+        """
+        Queue a negative sample, return its path relative to the store.
+        """
+        name = f"negative/{self.negativeCount}.jpg"
+        self.negativeCount += 1
+        self._queue.put((self._writeSample, ("negative", name, frame.copy(), None)))
+        return name
+
+    def addPositive(self, frame, rect):
+        """
+        Queue a positive sample labeled with rect, return its path.
+
+        rect is in frame coordinates, the label gets it scaled to size like
+        the stored image.
+        """
+        name = f"positive/{self.positiveCount}.jpg"
+        self.positiveCount += 1
+        height, width = frame.shape[:2]
+        scaleX, scaleY = self.size[0] / width, self.size[1] / height
+        x, y, w, h = rect
+        rect = (round(x * scaleX), round(y * scaleY), round(w * scaleX), round(h * scaleY))
+        label = f"0 {' '.join(str(x) for x in rect)}"
+        self._queue.put((self._writeSample, ("positive", name, frame.copy(), label)))
+        return name
+
+    def archive(self, filename=None):
+        """
+        Queue appending the samples added since the last archive to a tar.
+        """
+        filename = filename or f"{self.dirname}.tar"
+        self._queue.put((self._archive, (filename,)))
+
+    def close(self):
+        """
+        Finish the queued writes and stop the writer thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _work(self):
+        with open(os.path.join(self.dirname, NEGATIVE_FILENAME), "a") as negatives, \
+                open(self._manifestPath, "a") as manifest:
+            self._negatives = negatives
+            self._manifest = manifest
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    break
+                function, args = job
+                try:
+                    function(*args)
+                except Exception as e:
+                    self._logger.error(f"Sample Job Failed: {e}")
+
+    def _writeSample(self, kind, name, frame, label):
+        path = os.path.join(self.dirname, name)
+        cv2.imwrite(path, cv2.resize(frame, self.size))
+        if kind == "positive":
+            with open(f"{os.path.splitext(path)[0]}.txt", "w") as file:
+                file.write(f"{label}\n")
+            self._manifest.write(f"{kind} {name} {label}\n")
+        else:
+            self._negatives.write(f"{name}\n")
+            self._negatives.flush()
+            self._manifest.write(f"{kind} {name}\n")
+        self._manifest.flush()
+        self._state[kind] = max(self._state[kind], int(os.path.basename(name).split(".")[0]) + 1)
+        self._saveState(self._state)
+
+    def _archive(self, filename):
+        self._logger.info(f"Archive New Images To {filename}")
+        offset = self._state["archivedOffset"]
+        count = 0
+        # Plain tar can be appended to, and the JPEGs don't gzip anyway.
+        with open(self._manifestPath) as manifest, tarfile.open(filename, "a") as archive:
+            manifest.seek(offset)
+            for line in iter(manifest.readline, ""):
+                kind, name = line.split()[:2]
+                archive.add(os.path.join(self.dirname, name), name)
+                if kind == "positive":
+                    labelName = f"{os.path.splitext(name)[0]}.txt"
+                    archive.add(os.path.join(self.dirname, labelName), labelName)
+                count += 1
+            offset = manifest.tell()
+            if count:
+                for name in (NEGATIVE_FILENAME, MANIFEST_FILENAME):
+                    archive.add(os.path.join(self.dirname, name), name)
+        self._state["archivedOffset"] = offset
+        self._saveState(self._state)
+        self._logger.info(f"Archived {count} New Samples")
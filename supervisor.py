@@ -0,0 +1,240 @@
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy
+
+from manager import CaptureManager, WindowManager, openCapture
+from metrics import PipelineMetrics
+import tracing
+import utils
+from motion import MotionDetector
+from tracker import FaceTracker, ObjectTracker
+
+
+class DetectorPool(object):
+    """
+    Detection workers shared by all sources.
+
+    Every source has at most one detection in flight, so the FIFO queue
+    of the pool serves the sources round-robin. Trackers submitted here
+    must be built with perThread=True, so that every worker runs its own
+    copy of the shared cascades.
+    """
+
+    def __init__(self, workers):
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="Detector")
+
+    def submit(self, tracker, frame, region=None, sequence=None):
+        return self._executor.submit(self._update, tracker, frame, region, sequence)
+
+    @staticmethod
+    def _update(tracker, frame, region, sequence):
+        with tracing.span(f"{type(tracker).__name__}.update", sequence):
+            return tracker.update(frame, sequence, region)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SourcePipeline(object):
+    """
+    Capture, detection scheduling and drawing of one source.
+    """
+
+    def __init__(self, name, capture, pool, tracker, maxMisses=30, motion=None, frameReady=None, logger="SourcePipeline"):
+        self._logger = logging.getLogger(f"{logger}[{name}]")
+        self.name = name
+        self._pool = pool
+        self._captureManager = CaptureManager(capture, metrics=PipelineMetrics())
+        self._future = None
+        self._tracker = tracker
+        self._maxMisses = maxMisses
+        self._motion = motion
+        self._frameReady = frameReady
+        self.latestFrame = None
+        self.showFPS = False
+        self.isRunning = False
+
+    @property
+    def fps(self):
+        return self._captureManager.fps
+
+    def _collect(self, frame):
+        if self._future is not None and self._future.done():
+            try:
+                self._future.result()
+            except Exception as e:
+                self._logger.error(f"Detection Failed: {e}")
+            self._future = None
+        region = None
+        if self._motion is not None:
+            # Motion seen while a detection is in flight is kept for the next one.
+            region = self._motion.update(frame, self._future is None)
+            if region is None:
+                return
+        if self._future is None:
+            self._future = self._pool.submit(
+                self._tracker, frame.copy(), region, self._captureManager.frameSequence
+            )
+
+    def run(self):
+        self.isRunning = True
+        misses = 0
+        try:
+            while self.isRunning:
+                with self._captureManager as frame:
+                    if frame is None:
+                        misses += 1
+                        if misses >= self._maxMisses:
+                            self._logger.warning(f"No Frames From {self.name}, Stop Source")
+                            break
+                        continue
+                    misses = 0
+                    self._collect(frame)
+                    self._tracker.drawDebugRects(frame)
+                    if self.showFPS:
+                        color = 255 if utils.isGray(frame) else (0, 255, 0)
+                        cv2.putText(frame, self.fps, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
+                    self.latestFrame = frame
+                    if self._frameReady is not None:
+                        self._frameReady.set()
+        except cv2.error as e:
+            self._logger.error(e)
+        finally:
+            self.isRunning = False
+            self._captureManager.close()
+
+    def stop(self):
+        self.isRunning = False
+
+
+def tileFrames(frames, tileSize=(480, 360)):
+    """
+    Arrange frames in a near-square grid of tileSize cells.
+    """
+    columns = math.ceil(math.sqrt(len(frames)))
+    rows = math.ceil(len(frames) / columns)
+    width, height = tileSize
+    canvas = numpy.zeros((rows * height, columns * width, 3), dtype=numpy.uint8)
+    for index, frame in enumerate(frames):
+        if frame is None:
+            continue
+        if frame.ndim < 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        y, x = divmod(index, columns)
+        cv2.resize(frame, tileSize, canvas[y * height : (y + 1) * height, x * width : (x + 1) * width])
+    return canvas
+
+
+class CameoSupervisor(object):
+    """
+    Run one pipeline per source in one process, sharing the detectors.
+
+    The preview is tiled at most displayFps times a second, 30 by
+    default, and only when a source has a new frame.
+    """
+
+    def __init__(
+        self,
+        sources,
+        workers=2,
+        detect=None,
+        trashold=1.3,
+        preview=True,
+        replay=False,
+        rate="realtime",
+        loop=False,
+        motion=False,
+        gray=False,
+        displayFps=None,
+        tracePath=None,
+        traceCapacity=tracing.DEFAULT_CAPACITY,
+        logger="CameoSupervisor",
+    ):
+        self._logger = logging.getLogger(logger)
+        self._pool = DetectorPool(workers)
+        self._frameReady = threading.Event()
+        self._pipelines = [
+            SourcePipeline(
+                spec,
+                openCapture(spec, replay, rate, loop, gray),
+                self._pool,
+                self._createTracker(detect, trashold),
+                motion=MotionDetector() if motion else None,
+                frameReady=self._frameReady,
+            )
+            for spec in sources
+        ]
+        self._windowManager = (
+            WindowManager("Cameo", self.onKeypress, maxDisplayFps=displayFps) if preview else None
+        )
+        self._previewInterval = 1.0 / (displayFps or 30)
+        self._stopped = threading.Event()
+        self._tracePath = tracePath
+        if tracePath:
+            tracing.enable(traceCapacity)
+
+    @staticmethod
+    def _createTracker(detect, trashold):
+        if detect:
+            return ObjectTracker(detect, scaleFactor=trashold, perThread=True)
+        return FaceTracker(scaleFactor=trashold, minNeighbors=10, perThread=True)
+
+    def run(self):
+        """
+        Run Main loop.
+        """
+        threads = [
+            threading.Thread(target=pipeline.run, name=pipeline.name, daemon=True)
+            for pipeline in self._pipelines
+        ]
+        for thread in threads:
+            thread.start()
+        self._logger.info(f"Started {len(threads)} Sources")
+        try:
+            if self._windowManager is not None:
+                self._windowManager.createWindow()
+                while self._windowManager.isWindowCreated and any(t.is_alive() for t in threads):
+                    start = time.perf_counter()
+                    if self._frameReady.wait(self._previewInterval):
+                        self._frameReady.clear()
+                        self._windowManager.show(
+                            tileFrames([pipeline.latestFrame for pipeline in self._pipelines])
+                        )
+                    self._windowManager.processEvent()
+                    remaining = self._previewInterval - (time.perf_counter() - start)
+                    if remaining > 0:
+                        time.sleep(remaining)
+            else:
+                while not self._stopped.is_set() and any(t.is_alive() for t in threads):
+                    self._stopped.wait(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for pipeline in self._pipelines:
+                pipeline.stop()
+            for thread in threads:
+                thread.join(timeout=2)
+            self._pool.shutdown()
+            if tracing.isEnabled():
+                tracing.dump(self._tracePath)
+                tracing.disable()
+
+    def stop(self):
+        self._stopped.set()
+
+    def onKeypress(self, keycode):
+        """
+        Handle a keypress.
+        f -> Show/Hide FPS of every source.
+        escape -> Quit.
+        """
+        if keycode == ord("f"):
+            for pipeline in self._pipelines:
+                pipeline.showFPS = not pipeline.showFPS
+        elif keycode == 27:  # ESC
+            self._windowManager.destroyWindow()
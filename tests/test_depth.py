@@ -0,0 +1,49 @@
+import os
+import sys
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from depth import _histogramMedian, createMedianMask, createMedianMasks
+
+
+def _disparity(dtype, shape=(61, 80), seed=0):
+    rng = numpy.random.default_rng(seed)
+    high = 256 if dtype == numpy.uint8 else 4096
+    disparityMap = rng.integers(0, high, shape).astype(dtype)
+    validDepthMask = (rng.random(shape) > 0.2).astype(numpy.uint8) * 255
+    return disparityMap, validDepthMask
+
+
+def _expectedMask(disparityMap, validDepthMask, threshold=12):
+    median = numpy.median(disparityMap)
+    mask = (numpy.abs(disparityMap.astype(numpy.float64) - median) < threshold) | (validDepthMask == 0)
+    return mask.astype(numpy.uint8) * 255
+
+
+def test_histogramMedianMatchesNumpy():
+    for dtype in (numpy.uint8, numpy.uint16):
+        for shape in ((61, 80), (60, 80), (1, 1), (1, 2)):
+            disparityMap, _ = _disparity(dtype, shape)
+            assert _histogramMedian(disparityMap) == numpy.median(disparityMap)
+
+
+def test_medianMaskMatchesReference():
+    for dtype in (numpy.uint8, numpy.uint16, numpy.float32):
+        disparityMap, validDepthMask = _disparity(dtype)
+        dst = numpy.empty(disparityMap.shape, numpy.uint8)
+        mask = createMedianMask(disparityMap, validDepthMask, dst=dst)
+        assert mask is dst
+        numpy.testing.assert_array_equal(mask, _expectedMask(disparityMap, validDepthMask))
+
+
+def test_medianMasksOfRects():
+    disparityMap, validDepthMask = _disparity(numpy.uint16)
+    rects = [(0, 0, 20, 20), (30, 10, 40, 30), (70, 50, 40, 40)]
+    masks = createMedianMasks(disparityMap, validDepthMask, rects)
+    expected = numpy.zeros(disparityMap.shape, numpy.uint8)
+    for x, y, w, h in rects:
+        roi = (slice(y, y + h), slice(x, x + w))
+        expected[roi] |= _expectedMask(disparityMap[roi], validDepthMask[roi])
+    numpy.testing.assert_array_equal(masks, expected)
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detectionlog import INDEX_DTYPE, RECORD_DTYPE, DetectionLogReader, DetectionLogWriter, indexFilename
+from detections import DETECTION_DTYPE
+
+
+def _detections(frame, count):
+    detections = numpy.zeros(count, dtype=DETECTION_DTYPE)
+    detections["frame"] = frame
+    detections["label"] = numpy.arange(count) % 2
+    detections["rect"] = [frame, frame, 10, 10]
+    detections["score"] = 1.0
+    return detections
+
+
+def _write(filename, frames):
+    writer = DetectionLogWriter(filename, batchSize=4, flushInterval=1e9)
+    for frame in frames:
+        writer.append(_detections(frame, 2), timestamp=float(frame))
+    writer.close()
+
+
+def test_between(tmp_path):
+    filename = str(tmp_path / "detections.log")
+    _write(filename, range(10))
+    reader = DetectionLogReader(filename)
+    assert len(reader) == 20
+    assert len(reader.index) == 5
+    chunk = reader.between(3, 7)
+    assert chunk["timestamp"].tolist() == [3, 3, 4, 4, 5, 5, 6, 6]
+    assert reader.between(3, 7, label=1)["frame"].tolist() == [3, 4, 5, 6]
+    assert len(reader.between(20, 30)) == 0
+
+
+def test_reopenAfterInterruptedWrite(tmp_path):
+    filename = str(tmp_path / "detections.log")
+    _write(filename, range(10))
+    # An interrupted flush: half a record, and a whole index row plus half
+    # of another, both pointing past the log.
+    with open(filename, "ab") as file:
+        file.write(b"\0" * (RECORD_DTYPE.itemsize // 2))
+    with open(indexFilename(filename), "ab") as file:
+        file.write(numpy.array([(10.0, 20)], INDEX_DTYPE).tobytes())
+        file.write(b"\0" * (INDEX_DTYPE.itemsize // 2))
+    _write(filename, range(10, 14))
+    assert os.path.getsize(filename) == 28 * RECORD_DTYPE.itemsize
+    assert os.path.getsize(indexFilename(filename)) == 7 * INDEX_DTYPE.itemsize
+    reader = DetectionLogReader(filename)
+    assert reader.index["record"].tolist() == [0, 4, 8, 12, 16, 20, 24]
+    assert reader.between(8, 12)["timestamp"].tolist() == [8, 8, 9, 9, 10, 10, 11, 11]
+    assert reader.between(0, 100)["frame"].tolist() == numpy.repeat(numpy.arange(14), 2).tolist()
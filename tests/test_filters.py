@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import filters
+
+
+def _frames():
+    rng = numpy.random.default_rng(0)
+    yield rng.integers(0, 256, (480, 640, 3), dtype=numpy.uint8)
+    yield rng.integers(0, 256, (300, 200), dtype=numpy.uint8)
+
+
+def _filters():
+    return [filters.BlurFilter(), filters.SharpenFilter(), filters.StrokeEdgesFilter()]
+
+
+def test_stripsMatchWholeFrame():
+    for frame in _frames():
+        for curveFilter in _filters():
+            expected = numpy.empty_like(frame)
+            curveFilter.apply(frame.copy(), expected)
+            scheduler = filters.StripScheduler(curveFilter, workers=4)
+            # The second run reuses the scratch buffers of the first.
+            for _ in range(2):
+                dst = numpy.empty_like(frame)
+                scheduler.apply(frame, dst)
+                numpy.testing.assert_array_equal(dst, expected)
+
+
+def test_stripsMatchWholeFrameInPlace():
+    for frame in _frames():
+        for curveFilter in _filters():
+            expected = numpy.empty_like(frame)
+            curveFilter.apply(frame.copy(), expected)
+            scheduler = filters.StripScheduler(curveFilter, workers=4)
+            for _ in range(2):
+                dst = frame.copy()
+                scheduler.apply(dst, dst)
+                numpy.testing.assert_array_equal(dst, expected)
+
+
+def test_smallFramesRunWhole():
+    frame = numpy.full((100, 64, 3), 128, numpy.uint8)
+    expected = numpy.empty_like(frame)
+    filters.BlurFilter().apply(frame, expected)
+    dst = numpy.empty_like(frame)
+    filters.StripScheduler(filters.BlurFilter(), workers=4, minRows=64).apply(frame, dst)
+    numpy.testing.assert_array_equal(dst, expected)
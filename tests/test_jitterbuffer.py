@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cvclient import JitterBuffer
+
+# Sender clocks are unrelated to ours, the buffer only uses transit times.
+SENDER = 1000.0
+
+
+def _put(buffer, senderTimes, firstDueIn):
+    """
+    Put frames, in the given order, that arrive with one constant transit
+    so that frame 0.0 is due firstDueIn seconds from now.
+    """
+    now = time.perf_counter()
+    for senderTime in senderTimes:
+        buffer.put(SENDER + senderTime, senderTime, arrival=now + firstDueIn + senderTime)
+
+
+def test_playsInSenderOrder():
+    buffer = JitterBuffer()
+    # Frame 1 is received first, but frame 0 is due now and frame 1 in half a second.
+    _put(buffer, [1.0, 0.0], -0.5)
+    assert buffer.get(0) == 0.0
+    assert buffer.get(0) is None
+    assert buffer.get(2.0) == 1.0
+    assert (buffer.played, buffer.dropped, buffer.late) == (2, 0, 0)
+
+
+def test_countsLateFrames():
+    buffer = JitterBuffer()
+    _put(buffer, [0.0, 1.0], -1.0)
+    assert buffer.get(0) == 1.0
+    # Frame 0 was overtaken, frame 0.5 arrives after a newer frame played.
+    _put(buffer, [0.5], -1.0)
+    assert len(buffer) == 0
+    assert (buffer.played, buffer.dropped, buffer.late) == (1, 1, 1)
+
+
+def test_dropsOldestFramesOverCapacity():
+    buffer = JitterBuffer(capacity=2)
+    _put(buffer, [0.0, 1.0, 2.0], 10.0)
+    assert len(buffer) == 2
+    assert buffer.dropped == 1
+    assert sorted(data for _, data in buffer._frames) == [1.0, 2.0]
+
+
+def test_dropsOvertakenFrames():
+    buffer = JitterBuffer()
+    _put(buffer, [0.0, 0.1, 0.2, 10.0], -0.2)
+    assert buffer.get(0) == 0.2
+    assert (buffer.played, buffer.dropped) == (1, 2)
+    assert len(buffer) == 1
+
+
+def test_getReturnsNoneAtTheDeadline():
+    buffer = JitterBuffer()
+    started = time.perf_counter()
+    assert buffer.get(0.05) is None
+    assert time.perf_counter() - started >= 0.05
+    _put(buffer, [0.0], 10.0)
+    started = time.perf_counter()
+    assert buffer.get(0.05) is None
+    assert 0.05 <= time.perf_counter() - started < 1.0
+    assert buffer.played == 0
@@ -0,0 +1,120 @@
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+# Recorded spans are ("X" complete events of) the Chrome trace event format,
+# which chrome://tracing and ui.perfetto.dev both load.
+_events = None
+_threadNames = {}
+_local = threading.local()
+_logger = logging.getLogger("Trace")
+
+
+class _Span(object):
+    __slots__ = ("name", "frame", "start")
+
+    def __init__(self, name, frame):
+        self.name = name
+        self.frame = frame
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        complete(self.name, self.start, time.perf_counter(), self.frame)
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+# A span holds a tuple of 5 objects, about 200 bytes, so this is ~13 MB.
+DEFAULT_CAPACITY = 1 << 16
+
+
+def enable(capacity=DEFAULT_CAPACITY):
+    """
+    Start recording spans into a ring of the latest capacity spans.
+    """
+    global _events
+    _logger.info(f"Start Tracing Into A Buffer Of {capacity} Spans")
+    _events = collections.deque(maxlen=capacity)
+
+
+def disable():
+    global _events
+    _events = None
+
+
+def isEnabled():
+    return _events is not None
+
+
+def setFrame(sequence):
+    """
+    Tag the following spans of the calling thread with a frame sequence.
+    """
+    _local.frame = sequence
+
+
+def span(name, frame=None):
+    """
+    Return a context manager that records name as a span while tracing.
+    """
+    if _events is None:
+        return _NULL_SPAN
+    return _Span(name, frame)
+
+
+def complete(name, start, end, frame=None):
+    """
+    Record a span measured by the caller with time.perf_counter() stamps.
+    """
+    events = _events
+    if events is None:
+        return
+    tid = threading.get_ident()
+    if tid not in _threadNames:
+        _threadNames[tid] = threading.current_thread().name
+    if frame is None:
+        frame = getattr(_local, "frame", None)
+    events.append((name, start, end - start, tid, frame))
+
+
+def dump(path):
+    """
+    Write the recorded spans as Chrome trace JSON into path.
+    """
+    events = list(_events or ())
+    pid = os.getpid()
+    traceEvents = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+        for tid, name in list(_threadNames.items())
+    ]
+    for name, start, duration, tid, frame in events:
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": duration * 1e6,
+            "pid": pid,
+            "tid": tid,
+        }
+        if frame is not None:
+            event["args"] = {"frame": frame}
+        traceEvents.append(event)
+    with open(path, "w") as file:
+        json.dump({"traceEvents": traceEvents, "displayTimeUnit": "ms"}, file)
+    _logger.info(f"Dumped {len(events)} Spans Into {path}")
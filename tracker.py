@@ -1,74 +1,189 @@
 import cv2
+import numpy
 import os
+import threading
 import utils
 import logging
 
+from detections import FACE, OBJECT, drawDetections, makeDetections
 
-class Face(object):
-    def __init__(self):
-        self.faceRect = None
-        self.leftEyeRect = None
-        self.rightEyeRect = None
+CASCADE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "HaarCascades")
+
+_classifiers = {}
+_classifiersLock = threading.Lock()
+_threadClassifiers = threading.local()
+
+
+def resolveCascade(filename):
+    """
+    Resolve a cascade file name, falling back to the bundled HaarCascades.
+    """
+    if os.path.isabs(filename) or os.path.isfile(filename):
+        return os.path.abspath(filename)
+    for dirname in (os.path.dirname(CASCADE_DIR), CASCADE_DIR):
+        candidate = os.path.join(dirname, filename)
+        if os.path.isfile(candidate):
+            return candidate
+    return os.path.abspath(filename)
+
+
+def getClassifier(filename, perThread=False):
+    """
+    Return the process-wide CascadeClassifier of a cascade file.
+
+    Each file is parsed once, on first use, and shared by every tracker.
+    A classifier must not run detectMultiScale on two threads at once, so
+    trackers used from worker threads ask for a perThread copy.
+    """
+    path = resolveCascade(filename)
+    if perThread:
+        classifiers = getattr(_threadClassifiers, "classifiers", None)
+        if classifiers is None:
+            classifiers = _threadClassifiers.classifiers = {}
+        if path not in classifiers:
+            classifiers[path] = _loadClassifier(path)
+        return classifiers[path]
+    classifier = _classifiers.get(path)
+    if classifier is None:
+        with _classifiersLock:
+            classifier = _classifiers.get(path)
+            if classifier is None:
+                classifier = _classifiers[path] = _loadClassifier(path)
+    return classifier
+
+
+def _loadClassifier(path):
+    logging.getLogger("Classifiers").debug(f"Load Cascade {path}")
+    classifier = cv2.CascadeClassifier(path)
+    if classifier.empty():
+        raise cv2.error(f"Can't load cascade classifier {path}")
+    return classifier
+
+
+def _prepareImage(image, detectScale):
+    """
+    Return the equalized gray image to detect on, resized by detectScale.
+    """
+    if not utils.isGray(image):
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if detectScale != 1.0:
+        image = cv2.resize(
+            image, None, fx=detectScale, fy=detectScale, interpolation=cv2.INTER_AREA
+        )
+    return cv2.equalizeHist(image)
+
+
+def _scaleDetections(detections, detectScale):
+    if detectScale != 1.0:
+        for field in ("rect", "leftEye", "rightEye"):
+            detections[field] = detections[field] / detectScale
+
+
+def _cropRegion(image, region):
+    if region is None:
+        return image
+    x, y, w, h = region
+    return image[y : y + h, x : x + w]
+
+
+def _mergeRegion(previous, detections, region):
+    """
+    Move detections of region into frame coordinates and keep the
+    previous detections centered outside of region.
+    """
+    if region is None:
+        return detections
+    x, y, w, h = region
+    for field in ("rect", "leftEye", "rightEye"):
+        rects = detections[field]
+        rects[rects[:, 2] > 0, :2] += (x, y)
+    centers = previous["rect"][:, :2] + previous["rect"][:, 2:] // 2
+    outside = (
+        (centers[:, 0] < x) | (centers[:, 0] >= x + w) | (centers[:, 1] < y) | (centers[:, 1] >= y + h)
+    )
+    return numpy.concatenate([previous[outside], detections])
+
+
+def _minSize(image, divisor, detectScale):
+    w, h = utils.WHDividedBy(image, divisor)
+    return (int(w * detectScale), int(h * detectScale))
 
 
 class FaceTracker(object):
+    """
+    Detect faces and eyes into a structured detections array.
+    """
+
     def __init__(
         self,
         scaleFactor=1.3,
         minNeighbors=2,
         flags=cv2.CASCADE_SCALE_IMAGE,
+        perThread=False,
         logger="FaceTracker",
     ):
         self._logger = logging.getLogger(logger)
         self._logger.debug(f"Initial Class {logger}")
-        self.eyeClassifier = cv2.CascadeClassifier("HaarCascades/haarcascade_eye.xml")
-        self.faceClassifier = cv2.CascadeClassifier(
-            "HaarCascades/haarcascade_frontalface_default.xml"
-        )
+        self.perThread = perThread
+        self.eyeCascade = "haarcascade_eye.xml"
+        self.faceCascade = "haarcascade_frontalface_default.xml"
         self.scaleFactor = scaleFactor
         self.minNeighbors = minNeighbors
         self.flags = flags
-        self._faces = []
+        self.detectScale = 1.0
+        self.searchEyes = True
+        self._faces = makeDetections([], FACE)
+        self._updates = 0
+
+    @property
+    def eyeClassifier(self):
+        return getClassifier(self.eyeCascade, self.perThread)
+
+    @property
+    def faceClassifier(self):
+        return getClassifier(self.faceCascade, self.perThread)
 
     @property
     def faces(self):
+        """
+        Detections of the last update, one DETECTION_DTYPE row per face.
+        """
         return self._faces
 
-    def update(self, image):
-        self._faces = []
-        if utils.isGray(image):
-            image = cv2.equalizeHist(image)
-        else:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            image = cv2.equalizeHist(gray)
-        minSize = utils.WHDividedBy(image, 8)
-        facesRect = self.faceClassifier.detectMultiScale(
+    def update(self, image, frame=None, region=None):
+        """
+        Detect faces in image, or only in the (x, y, w, h) region of it.
+
+        With a region, faces found before outside of it are kept.
+        """
+        if frame is None:
+            frame = self._updates
+        self._updates += 1
+        minSize = _minSize(image, 8, self.detectScale)
+        image = _prepareImage(_cropRegion(image, region), self.detectScale)
+        facesRect, neighbors = self.faceClassifier.detectMultiScale2(
             image, self.scaleFactor, self.minNeighbors, self.flags, minSize
         )
-        if facesRect is not None:
-            for faceRect in facesRect:
-                face = Face()
-                face.faceRect = faceRect
-                x, y, w, h = faceRect
-                self._logger.debug(f"x: {x}, y: {y} face detected")
-                searchRect = (x, y, w, h)
-                lEyeRect = self._detectOneObject(
-                    self.eyeClassifier, image, searchRect, 64
-                )
-                if lEyeRect:
-                    self._logger.debug(f"Left eye detected")
-                face.leftEyeRect = lEyeRect
-                searchRect = (x, y, w, h)
-                rEyeRect = self._detectOneObject(
-                    self.eyeClassifier, image, searchRect, 64
-                )
-                if rEyeRect:
-                    self._logger.debug(f"Right eye detected")
-                face.rightEyeRect = rEyeRect
-                self._faces.append(face)
-            return True
-        else:
-            return False
+        faces = makeDetections(facesRect, FACE, frame, neighbors)
+        for index in range(len(faces) if self.searchEyes else 0):
+            x, y, w, h = faces["rect"][index].tolist()
+            self._logger.debug(f"x: {x}, y: {y} face detected")
+            searchRect = (x, y, w, h)
+            lEyeRect = self._detectOneObject(
+                self.eyeClassifier, image, searchRect, 64
+            )
+            if lEyeRect:
+                self._logger.debug(f"Left eye detected")
+                faces["leftEye"][index] = lEyeRect
+            rEyeRect = self._detectOneObject(
+                self.eyeClassifier, image, searchRect, 64
+            )
+            if rEyeRect:
+                self._logger.debug(f"Right eye detected")
+                faces["rightEye"][index] = rEyeRect
+        _scaleDetections(faces, self.detectScale)
+        self._faces = _mergeRegion(self._faces, faces, region)
+        return True
 
     def _detectOneObject(self, classifier, image, searchRect, imageSizeToMinSizeRatio):
         minSize = utils.WHDividedBy(image, imageSizeToMinSizeRatio)
@@ -83,67 +198,68 @@ class FaceTracker(object):
         return (x + subx, y + suby, subw, subh)
 
     def drawDebugRects(self, image):
-        def check(x):
-            return getattr(face, x) is not None
-
-        if utils.isGray(image):
-            colors = {"faceRect": 255, "leftEyeRect": 255, "rightEyeRect": 255}
-        else:
-            colors = {
-                "faceRect": (255, 255, 255),
-                "leftEyeRect": (0, 0, 255),
-                "rightEyeRect": (0, 255, 255),
-            }
-
-        for face in self._faces:
-            for attribute in list(
-                filter(check, [x for x in dir(face) if not x.startswith("_")])
-            ):
-                utils.outlineRect(
-                    image, getattr(face, attribute), colors.get(attribute, 255)
-                )
+        drawDetections(image, self._faces)
 
 
 
 class ObjectTracker(object):
+    """
+    Detect objects of one cascade into a structured detections array.
+    """
+
     def __init__(
         self,
         classifier,
         scaleFactor=1.3,
         minNeighbors=2,
         flags=cv2.CASCADE_SCALE_IMAGE,
+        perThread=False,
         logger="ObjectTracker"
     ):
         self._logger = logging.getLogger(logger)
         self.scaleFactor = scaleFactor
         self.minNeighbors = minNeighbors
         self.flags = flags
-        if not (os.path.exists(classifier) and os.path.isfile(classifier)):
+        self.detectScale = 1.0
+        self._detectedObjRect = makeDetections([], OBJECT)
+        self._updates = 0
+        self.perThread = perThread
+        self._cascade = classifier
+        if not os.path.isfile(resolveCascade(classifier)):
             self._logger.error('The Cascade Classifier File Not Exist')
-            self.classifier = None
-            return 
-        self.classifier = cv2.CascadeClassifier(classifier)
-        self._detectedObjRect = []
+            self._cascade = None
+
+    @property
+    def classifier(self):
+        if self._cascade is None:
+            return None
+        return getClassifier(self._cascade, self.perThread)
 
     @property
     def objects(self):
+        """
+        Detections of the last update, one DETECTION_DTYPE row per object.
+        """
         return self._detectedObjRect
 
-    def update(self, image):
-        if utils.isGray(image):
-            image = cv2.equalizeHist(image)
-        else:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            image = cv2.equalizeHist(gray)
-        objRect = self.classifier.detectMultiScale(
-            image, self.scaleFactor, self.minNeighbors, self.flags, (100,100)
-        )
+    def update(self, image, frame=None, region=None):
+        """
+        Detect objects in image, or only in the (x, y, w, h) region of it.
 
-        if objRect is not None:
-            self._detectedObjRect = objRect
-            return True
-        return False
+        With a region, objects found before outside of it are kept.
+        """
+        if frame is None:
+            frame = self._updates
+        self._updates += 1
+        image = _prepareImage(_cropRegion(image, region), self.detectScale)
+        minSize = int(100 * self.detectScale)
+        objRect, neighbors = self.classifier.detectMultiScale2(
+            image, self.scaleFactor, self.minNeighbors, self.flags, (minSize, minSize)
+        )
+        objects = makeDetections(objRect, OBJECT, frame, neighbors)
+        _scaleDetections(objects, self.detectScale)
+        self._detectedObjRect = _mergeRegion(self._detectedObjRect, objects, region)
+        return True
 
     def drawDebugRects(self, image):
-        for obj in self._detectedObjRect:
-            utils.outlineRect(image, obj, 255)
+        drawDetections(image, self._detectedObjRect, ("rect",), {"rect": (255, 0, 0)})
@@ -2,7 +2,7 @@ import cv2
 
 
 def isGray(image):
-    return image.ndim < 3
+    return image.ndim < 3 or image.shape[2] == 1
 
 
 def WHDividedBy(image, divisor):
@@ -1,7 +1,10 @@
 import cv2
+import logging
 import numpy
 import pyzed.sl as sl
 
+from depth import DepthQuery
+
 
 class ZedCameraClass(sl.Camera):
     def __init__(self, logger="ZedCameraClass"):
@@ -72,9 +75,17 @@ class ZedCameraClass(sl.Camera):
             self.close()
             self._isOpened = False
 
-    def distance(self, x, y):
+    def depthQuery(self):
+        """
+        Fetch the depth map once and return a DepthQuery in meters over it.
+        """
         depth = self.compute_depth_map()
-        if depth is not None:
-            depth_np = depth.get_data()
-            return depth_np[y,x] / 1000.0
+        if depth is None:
+            return None
+        return DepthQuery(depth.get_data(), scale=1 / 1000.0)
+
+    def distance(self, x, y):
+        query = self.depthQuery()
+        if query is not None:
+            return query.distance(x, y)
         return None